@@ -1,9 +1,10 @@
+import asyncio
 from authx import AuthX, AuthXConfig, RequestToken
 from settings import settings
 from datetime import timedelta
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.dals import UserDAL
-from api.schemas import UserShowDTO
+from api.schemas import UserShowDTO, UserPrincipalDTO
 from sqlalchemy.dialects.postgresql import UUID
 from typing import Optional
 from hashing import Hasher
@@ -12,6 +13,7 @@ from fastapi import Depends, HTTPException, status
 from db.database import get_db
 from jose import JWTError
 from db.models.models import UsersOrm
+from services.redis_service import redis_client, redis_breaker
 
 
 config = AuthXConfig(
@@ -33,13 +35,121 @@ async def _get_user_by_id_for_auth(user_id: UUID, session: AsyncSession) -> User
         user_dal = UserDAL(db_session=session)
         return await user_dal.get_user_by_id(user_id=user_id)
 
+# Authenticated users cached in Redis so most requests skip the users SELECT.
+# Entries are dropped by invalidate_principal() whenever a user is updated or
+# deleted; the short TTL bounds staleness if that DEL is missed.
+# invalidate_principal() also bumps a per-user version and a fill only lands
+# while the version it read before the SELECT is unchanged, so a fill racing
+# with an update can't put the old roles back.
+# An invalidation that fails is kept in _pending_invalidations: this worker
+# skips the cache for that user and retry_principal_invalidations() retries
+# it until Redis takes it.
+PRINCIPAL_VERSION_TTL = 86400
+
+_pending_invalidations: set[str] = set()
+
+def _principal_key(user_id) -> str:
+    return f"users:principal:{user_id}"
+
+def _principal_version_key(user_id) -> str:
+    return f"users:principal:{user_id}:version"
+
+_set_if_version = redis_client.register_script("""
+if (redis.call('GET', KEYS[2]) or '') == ARGV[1] then
+    return redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+end
+return false
+""")
+
+async def _get_cached_principal(user_id: str) -> tuple[Optional[UsersOrm], Optional[str]]:
+    """ The cached user and the version to fill with on a miss;
+    version None means the cache must not be filled """
+    if str(user_id) in _pending_invalidations:
+        return None, None
+    if not redis_breaker.allow_request():
+        return None, None
+    try:
+        cached_data, version = await redis_client.mget(_principal_key(user_id), _principal_version_key(user_id))
+        redis_breaker.record_success()
+    except Exception as e:
+        print(f"Redis error (read): {e}")
+        redis_breaker.record_failure()
+        return None, None
+    version = version.decode() if version is not None else ""
+    if cached_data is None:
+        return None, version
+    return UsersOrm(**UserPrincipalDTO.model_validate_json(cached_data).model_dump()), version
+
+async def _cache_principal(user: UsersOrm, version: str):
+    if not redis_breaker.allow_request():
+        return
+    try:
+        principal_dto = UserPrincipalDTO.model_validate(user, from_attributes=True)
+        await _set_if_version(
+            keys=[_principal_key(user.user_id), _principal_version_key(user.user_id)],
+            args=[version, principal_dto.model_dump_json(), settings.PRINCIPAL_CACHE_TTL],
+        )
+        redis_breaker.record_success()
+    except Exception as e:
+        print(f"Redis error (write): {e}")
+        redis_breaker.record_failure()
+
+async def invalidate_principal(user_id) -> bool:
+    """ Not gated by the breaker: a skipped invalidation would keep serving
+    the old user. Returns False if it failed and is pending a retry """
+    user_id = str(user_id)
+    _pending_invalidations.add(user_id)
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.incr(_principal_version_key(user_id))
+            pipe.expire(_principal_version_key(user_id), PRINCIPAL_VERSION_TTL)
+            pipe.delete(_principal_key(user_id))
+            await pipe.execute()
+        redis_breaker.record_success()
+    except Exception as e:
+        print(f"Redis error (invalidate): {e}")
+        redis_breaker.record_failure()
+        return False
+    _pending_invalidations.discard(user_id)
+    return True
+
+async def retry_principal_invalidations():
+    """ Background task: retries failed invalidations every probe interval """
+    while True:
+        await asyncio.sleep(settings.REDIS_HEALTH_PROBE_INTERVAL)
+        for user_id in list(_pending_invalidations):
+            if not await invalidate_principal(user_id):
+                # still down, the rest wait for the next round
+                break
+
+async def _get_principal(user_id: str, session: AsyncSession) -> Optional[UsersOrm]:
+    """ The user behind a verified token, from the cache or the database """
+    user, version = await _get_cached_principal(user_id)
+    if user is not None:
+        return user
+    user = await _get_user_by_id_for_auth(user_id, session=session)
+    if user is not None and version is not None:
+        await _cache_principal(user, version)
+    return user
+
 async def authenticate_user(email: str, password: str, session: AsyncSession) -> Optional[UserShowDTO]:
     user = await _get_user_by_email_for_auth(email=email, session=session)
     if user is None:
          return None
          
-    if not Hasher.verify_password(plain_password=password, hashed_password=user.hashed_password):
+    if not await Hasher.verify_password_async(plain_password=password, hashed_password=user.hashed_password):
         return None
+
+    # the plain password is only available here, so upgrade outdated hashes on login
+    if Hasher.needs_rehash(user.hashed_password):
+        try:
+            new_hashed_password = await Hasher.get_password_hash_async(password)
+            async with session.begin():
+                user_dal = UserDAL(db_session=session)
+                await user_dal.update_user(user_id=user.user_id, hashed_password=new_hashed_password)
+            user.hashed_password = new_hashed_password
+        except Exception as e:
+            print(f"Password rehash failed for {user.user_id}: {e}")
     return user       
     
 
@@ -63,7 +173,7 @@ async def get_current_user_from_token(
                   raise cred_exception
         except JWTError:
              raise cred_exception
-        user = await _get_user_by_id_for_auth(user_id, session=db)
+        user = await _get_principal(user_id, session=db)
         if user is None:
              raise cred_exception
         return user      
@@ -1,12 +1,93 @@
 import socketio
+import asyncio
+import base64
+import datetime
+import json
+from http.cookies import SimpleCookie
+from typing import Optional
+from bson import ObjectId
+from beanie import SortDirection
 from db.models.models_mongodb import Message
+from settings import settings
+from authx import RequestToken
+from api.actions.auth import security, config, _get_principal
+from db.database import async_session_factory
+from services.write_behind import WriteBehindBuffer
+from services.recent_messages import RecentMessages, MessageKey
+from services.rate_limit import TokenBucketLimiter
+from services.redis_service import redis_client, redis_breaker
 
-sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins="*")
 
+def _client_manager() -> Optional[socketio.AsyncManager]:
+    """ Manager that fans emits out to every server process; None keeps
+    rooms in this process only """
+    if settings.CHAT_MANAGER == "redis":
+        url = settings.CHAT_MANAGER_URL or f"redis://:{settings.REDIS_PASS}@{settings.REDIS_HOST}:{settings.REDIS_PORT}/0"
+        return socketio.AsyncRedisManager(url, channel=settings.CHAT_MANAGER_CHANNEL)
+    if settings.CHAT_MANAGER == "amqp":
+        url = settings.CHAT_MANAGER_URL or settings.CELERY_BROKER_URL
+        return socketio.AsyncAioPikaManager(url, channel=settings.CHAT_MANAGER_CHANNEL)
+    return None
+
+
+sio = socketio.AsyncServer(
+    async_mode='asgi',
+    cors_allowed_origins="*",
+    client_manager=_client_manager(),
+    # engine.io refuses larger packets before they are decoded
+    max_http_buffer_size=settings.CHAT_MAX_PACKET_SIZE,
+)
+
+# per process; a sender connected to several processes gets a bucket in each
+sid_limiter = TokenBucketLimiter(rate=settings.CHAT_RATE_PER_SID, burst=settings.CHAT_BURST_PER_SID)
+sender_limiter = TokenBucketLimiter(rate=settings.CHAT_RATE_PER_SENDER, burst=settings.CHAT_BURST_PER_SENDER)
+
+# clients of this process that broadcasts currently skip, see watch_slow_consumers()
+slow_consumers: set[str] = set()
+
+chat_metrics = {
+    "rejected_rate_limited": 0,
+    "rejected_too_large": 0,
+    "rejected_busy": 0,
+    "dropped_slow_consumer": 0,
+    "disconnected_slow_consumer": 0,
+}
+
+# started / flushed by the app lifespan
+message_buffer = WriteBehindBuffer(
+    document_model=Message,
+    max_batch=settings.CHAT_WRITE_BATCH_SIZE,
+    flush_interval=settings.CHAT_WRITE_FLUSH_INTERVAL,
+    max_pending=settings.CHAT_WRITE_MAX_PENDING,
+)
+
+
+def _connect_token(environ: dict, auth: Optional[dict]) -> Optional[str]:
+    # socket.io `auth` payload first, then the login cookie
+    if isinstance(auth, dict) and auth.get("token"):
+        return auth["token"]
+    cookie = SimpleCookie(environ.get("HTTP_COOKIE", ""))
+    morsel = cookie.get(config.JWT_ACCESS_COOKIE_NAME)
+    return morsel.value if morsel is not None else None
 
 @sio.event
-async def connect(sid, environ):
-    print(f'Client {sid} connected to common room')
+async def connect(sid, environ, auth=None):
+    # the token is verified once here; messages use the identity saved in the session
+    token = _connect_token(environ, auth)
+    if token is None:
+        raise socketio.exceptions.ConnectionRefusedError("Not authenticated")
+    try:
+        payload = security.verify_token(RequestToken(token=token, type="access", location="headers"))
+    except Exception:
+        raise socketio.exceptions.ConnectionRefusedError("Could not validate credentials")
+
+    async with async_session_factory() as session:
+        user = await _get_principal(payload.sub, session=session)
+    if user is None:
+        raise socketio.exceptions.ConnectionRefusedError("Could not validate credentials")
+
+    await sio.save_session(sid, {"user_id": user.user_id, "name": user.name})
+    print(f'Client {sid} ({user.user_id}) connected to common room')
 
     await sio.enter_room(sid, "common_room")
 
@@ -14,35 +95,234 @@ async def connect(sid, environ):
 async def disconnect(sid):
     print(f'Client {sid} disconnected from common room')
 
+    sid_limiter.forget(sid)
+    slow_consumers.discard(sid)
     await sio.leave_room(sid, 'common_room')
 
+async def _reject(sid, reason: str, text: Optional[str] = None):
+    chat_metrics[f"rejected_{reason}"] += 1
+    await sio.emit("message_rejected", {"reason": reason, "text": text}, to=sid)
+
 @sio.event
 async def message(sid, data: dict):
-    print(f'Message was recieved from {sid}: {data}')
-    text = data.get("text", "").strip()
-    sender_id = data.get("sender_id")
-    sender_name = data.get("sender_name", "Anonist") 
-
-    if not text or not sender_id:
+    if not isinstance(data, dict):
+        return
+    text = str(data.get("text", "")).strip()
+    if not text:
+        return
+    if len(text) > settings.CHAT_MAX_MESSAGE_LENGTH:
+        await _reject(sid, "too_large")
+        return
+    # identity comes from the session, any sender fields in the payload are ignored
+    user = await sio.get_session(sid)
+    sender_id = user["user_id"]
+    sender_name = user["name"]
+    # the sid bucket first, so a flooding connection can't drain its sender's bucket
+    if not (sid_limiter.allow(sid) and sender_limiter.allow(sender_id)):
+        await _reject(sid, "rate_limited", text)
         return
 
-    msg = await Message(
+    # the id is assigned here so the broadcast and the later batched insert agree
+    msg = Message(
+        id=ObjectId(),
         sender_id=sender_id,
         sender_name=sender_name,
         text=text
-    ).insert()
+    )
+    if not message_buffer.put_nowait(msg):
+        # storage is too far behind: refuse rather than broadcast what can't be saved
+        await _reject(sid, "busy", text)
+        return
+
+    key, value = _recent_entry(msg)
+    recent_messages.add(key, value)
 
+    chat_metrics["dropped_slow_consumer"] += len(slow_consumers - {sid})
     await sio.emit(
-        "new_message", {
-         "id": str(msg.id),
-         "sender_id": sender_id,
-         "sender_name": sender_name,
-         "text": text,
-         "created_at": msg.created_at.isoformat()  
-         },
+        "new_message", _serialize_message(msg),
          room="common_room",
-         skip_sid=sid 
+         skip_sid=[sid, *slow_consumers]
     )
+    await _publish_recent(value)
+
+
+
+async def _abort_connection(socket):
+    """ Closes an engine.io socket without sending its backlog; a normal
+    disconnect would wait for the queue to drain """
+    while not socket.queue.empty():
+        socket.queue.get_nowait()
+        socket.queue.task_done()
+    await socket.close(wait=False, abort=True)
+    # wakes the writer task, which then closes the websocket
+    await socket.queue.put(None)
+
+async def watch_slow_consumers():
+    """ Background task: checks the send queue of every client of this
+    process. Broadcasts skip clients above CHAT_SLOW_CONSUMER_QUEUE until
+    they catch up, clients above CHAT_MAX_SEND_QUEUE are disconnected """
+    while True:
+        await asyncio.sleep(settings.CHAT_SLOW_CONSUMER_INTERVAL)
+        slow = set()
+        for eio_sid, socket in list(sio.eio.sockets.items()):
+            sid = sio.manager.sid_from_eio_sid(eio_sid, "/")
+            if sid is None or socket.closed:
+                continue
+            queued = socket.queue.qsize()
+            if queued > settings.CHAT_MAX_SEND_QUEUE:
+                print(f'Client {sid} disconnected, {queued} packets waiting')
+                chat_metrics["disconnected_slow_consumer"] += 1
+                await _abort_connection(socket)
+            elif queued > settings.CHAT_SLOW_CONSUMER_QUEUE:
+                slow.add(sid)
+        slow_consumers.clear()
+        slow_consumers.update(slow)
+
+def get_chat_stats() -> dict:
+    return {
+        **chat_metrics,
+        "slow_consumers": len(slow_consumers),
+        "write_buffer": message_buffer.stats(),
+        "recent_messages": recent_messages.stats(),
+    }
+
+
+def _as_utc(value: datetime.datetime) -> datetime.datetime:
+    # Mongo hands datetimes back naive (in UTC), new messages carry a timezone
+    return value if value.tzinfo is not None else value.replace(tzinfo=datetime.timezone.utc)
+
+def encode_message_cursor(created_at: datetime.datetime, message_id: ObjectId) -> str:
+    raw = f"{_as_utc(created_at).isoformat()}|{message_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_message_cursor(cursor: str) -> tuple[datetime.datetime, ObjectId]:
+    # raises ValueError on anything that was not produced by encode_message_cursor
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, message_id = raw.split("|")
+        return _as_utc(datetime.datetime.fromisoformat(created_at)), ObjectId(message_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+def _serialize_message(m: Message) -> dict:
+    return {
+        "id": str(m.id),
+        "sender_id": str(m.sender_id),
+        "sender_name": m.sender_name,
+        "text": m.text,
+        "created_at": _as_utc(m.created_at).isoformat()
+    }
+
+def _recent_entry(m: Message) -> tuple[MessageKey, bytes]:
+    return (_as_utc(m.created_at), m.id), json.dumps(_serialize_message(m)).encode()
+
+
+# latest messages of the whole chat in every process: the message handler
+# adds its own, the ones sent through other processes arrive on
+# CHAT_MESSAGES_CHANNEL and gaps heal on the periodic re-warm from Mongo
+CHAT_MESSAGES_CHANNEL = "chat:messages"
+recent_messages = RecentMessages(max_items=settings.CHAT_RECENT_MESSAGES)
+
+async def warm_recent_messages():
+    messages = await (
+        Message.find({})
+        .sort([("created_at", SortDirection.DESCENDING), ("_id", SortDirection.DESCENDING)])
+        .limit(settings.CHAT_RECENT_MESSAGES)
+        .to_list()
+    )
+    recent_messages.warm(
+        [_recent_entry(m) for m in messages],
+        has_all=len(messages) < settings.CHAT_RECENT_MESSAGES,
+    )
+
+async def _publish_recent(value: bytes):
+    try:
+        if redis_breaker.allow_request():
+            await redis_client.publish(CHAT_MESSAGES_CHANNEL, value)
+            redis_breaker.record_success()
+    except Exception as e:
+        print(f"Redis error (chat publish): {e}")
+        redis_breaker.record_failure()
+
+def _apply_published(value: bytes):
+    data = json.loads(value)
+    key = (datetime.datetime.fromisoformat(data["created_at"]), ObjectId(data["id"]))
+    recent_messages.add(key, value)
+
+async def listen_chat_messages():
+    """ Background task: adds messages sent through other processes to
+    recent_messages and re-warms it every CHAT_RECENT_REWARM_INTERVAL """
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            async with redis_client.pubsub() as pubsub:
+                await pubsub.subscribe(CHAT_MESSAGES_CHANNEL)
+                # anything published while we were not subscribed is lost
+                warmed_at = 0.0
+                while True:
+                    if loop.time() - warmed_at >= settings.CHAT_RECENT_REWARM_INTERVAL:
+                        await warm_recent_messages()
+                        warmed_at = loop.time()
+                    # poll with a timeout: a blocking read would trip the pool's socket_timeout
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None:
+                        _apply_published(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Redis error (chat pubsub): {e}")
+            redis_breaker.record_failure()
+            await asyncio.sleep(1)
+
+
+def _join_page(values: list[bytes]) -> bytes:
+    return b"[" + b",".join(values) + b"]"
+
+async def _get_chat_history(
+        limit: int,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+) -> tuple[bytes, Optional[str], Optional[str]]:
+    """ A page of messages in chronological order as JSON bytes: the latest
+    ones, the ones older than `before` or the ones newer than `after`. Also
+    returns the cursors for the next older / newer page when there may be
+    one. Pages within recent_messages are served from memory, older ones
+    are a seek on the (created_at, _id) index """
+    if before is not None and after is not None:
+        raise ValueError("Only one of before / after can be given")
+    before_key = decode_message_cursor(before) if before is not None else None
+    after_key = decode_message_cursor(after) if after is not None else None
+
+    entries = recent_messages.page(limit, before=before_key, after=after_key)
+    if entries is None:
+        if after_key is not None:
+            created_at, message_id = after_key
+            query = Message.find({"$or": [
+                {"created_at": {"$gt": created_at}},
+                {"created_at": created_at, "_id": {"$gt": message_id}},
+            ]}).sort([("created_at", SortDirection.ASCENDING), ("_id", SortDirection.ASCENDING)])
+        else:
+            query = Message.find({})
+            if before_key is not None:
+                created_at, message_id = before_key
+                query = Message.find({"$or": [
+                    {"created_at": {"$lt": created_at}},
+                    {"created_at": created_at, "_id": {"$lt": message_id}},
+                ]})
+            query = query.sort([("created_at", SortDirection.DESCENDING), ("_id", SortDirection.DESCENDING)])
 
+        messages = await query.limit(limit).to_list()
+        if after_key is None:
+            messages.reverse()
+        entries = [_recent_entry(m) for m in messages]
 
+    # a full page means there may be more in the direction we paged
+    before_cursor = None
+    after_cursor = None
+    if len(entries) == limit:
+        if after_key is None:
+            before_cursor = encode_message_cursor(*entries[0][0])
+        else:
+            after_cursor = encode_message_cursor(*entries[-1][0])
 
+    return _join_page([value for _, value in entries]), before_cursor, after_cursor
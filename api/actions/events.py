@@ -1,31 +1,41 @@
-from db.dals import EventsDAL
-from db.models.models import EventsOrm
+from db.dals import EventsDAL, PhotosDAL
+from db.database import async_session_factory
+from db.models.models import EventsOrm, PhotosOrm
 from sqlalchemy.dialects.postgresql import UUID
-from api.schemas import EventAddDTO, EventShowDTO
-from typing import Optional
+from api.schemas import (EventAddDTO, EventShowDTO, PresignedUploadRequest, PresignedUploadResponse,
+                         UPLOAD_CONTENT_TYPES)
+from typing import Optional, Callable, Awaitable
 import uuid
 import datetime
 from sqlalchemy.inspection import inspect
-import redis.asyncio as redis_async
+from sqlalchemy.exc import IntegrityError
 import asyncio
 import json
+import base64
+import re
 from fastapi import UploadFile
 from pydantic import TypeAdapter
 from settings import settings
 from services.s3_service import s3_client
+from services.feed_cache import (FEED_HEAD_VERSION_KEY, FEED_TAIL_VERSION_KEY, FEED_CACHE_TTL, feed_head_cache,
+                                 feed_tail_cache, event_local_cache, get_feed_version, invalidate_feed_cache)
+from services.redis_service import redis_client, redis_breaker
 from services.resize_images import optimize_image_task
+from services.storage_tasks import delete_s3_object_task
 import logging
 
 log = logging.getLogger(__name__)
 
 
-redis_client = redis_async.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT,password=settings.REDIS_PASS , decode_responses=True)
-
-async def redis_available():
-    try:
-        return await redis_client.ping()
-    except:
-        return False
+def get_cache_stats() -> dict:
+    return {
+        "local": {
+            "feed_head": feed_head_cache.stats(),
+            "feed_tail": feed_tail_cache.stats(),
+            "event": event_local_cache.stats(),
+        },
+        "redis": {"hits": hit, "misses": miss},
+    }
 
 def orm_to_dict(obj: EventsOrm):
     dict1 = {}
@@ -38,98 +48,456 @@ def orm_to_dict(obj: EventsOrm):
     return dict1
 
 
+async def _delete_s3_object(s3_key: str):
+    """ Best-effort delete; on failure the worker takes over and retries """
+    try:
+        await s3_client.delete_file(s3_key=s3_key)
+    except Exception as e:
+        log.warning(f"S3 delete of {s3_key} failed, scheduling cleanup: {e}")
+        delete_s3_object_task.delay(s3_key=s3_key)
+
+
+def _event_photo_keys(event: EventsOrm | PhotosOrm) -> set[str]:
+    """ S3 keys of the photo and all of its variants """
+    urls = {event.photo} if event.photo else set()
+    for variant in (event.photo_variants or {}).values():
+        urls.update(variant["urls"].values())
+    return {url.split('/')[-1] for url in urls}
+
+
+async def _release_photo(event: EventsOrm, session):
+    """ Deletes the storage objects of a removed or replaced photo, unless
+    other events still reference the same content """
+    if event.photo_hash is None:
+        s3_keys = _event_photo_keys(event)
+    else:
+        try:
+            async with session.begin():
+                photos_dal = PhotosDAL(session)
+                photo = await photos_dal.delete_unreferenced(content_hash=event.photo_hash)
+        except IntegrityError:
+            # another event picked up the same content meanwhile
+            return
+        if photo is None:
+            return
+        s3_keys = _event_photo_keys(photo)
+
+    for s3_key in s3_keys:
+        await _delete_s3_object(s3_key)
+
+
+async def _discard_upload(content_hash: str, s3_key: str, session):
+    """ Deletes an object uploaded for a failed insert, unless a concurrent
+    upload of the same bytes has registered it meanwhile """
+    try:
+        async with session.begin():
+            photos_dal = PhotosDAL(session)
+            stored_photo = await photos_dal.get_photo(content_hash=content_hash)
+    except Exception as e:
+        log.warning(f"Can't check photo {content_hash}, keeping {s3_key}: {e}")
+        return
+    if stored_photo is None:
+        await _delete_s3_object(s3_key)
+
+
 async def _create_new_event(cred: EventAddDTO, uploaded_file: UploadFile | None, session) -> EventShowDTO:
-    async with session.begin():
-        s3_url_photo = None
-        if uploaded_file is not None:
-
-            # 'https://{self.static_domain}/{unique_filename}'
-            s3_url_photo = await s3_client.upload_file(
-                    filename=uploaded_file.filename,
-                    file=uploaded_file.file, # BinaryIO
-                )   
-        event_dal = EventsDAL(session)
-        created_event_orm = await event_dal.create_event(
-            title=cred.title,
-            text=cred.text,
-            author_id=cred.author_id,
-            photo=s3_url_photo,
-        )
+    # Upload before opening the transaction so a slow upload never holds a
+    # pooled connection. Photos are keyed by their content hash: bytes that
+    # are already stored are neither uploaded nor optimized again.
+    content_hash = None
+    s3_key = None
+    uploaded = False
+    if uploaded_file is not None:
+        content_hash = await s3_client.hash_file(uploaded_file.file)
+        extension = uploaded_file.filename.split(".")[-1].lower()
+        s3_key = f"{content_hash}.{extension}"
+
+        async with session.begin():
+            photos_dal = PhotosDAL(session)
+            stored_photo = await photos_dal.get_photo(content_hash=content_hash)
+        if stored_photo is None:
+            await s3_client.put_file(s3_key=s3_key, file=uploaded_file.file)
+            uploaded = True
+
+    photo_created = False
+    try:
+        async with session.begin():
+            photo = None
+            photo_variants = None
+            if content_hash is not None:
+                photos_dal = PhotosDAL(session)
+                photo_orm, photo_created = await photos_dal.acquire_photo(
+                    content_hash=content_hash,
+                    photo=s3_client.get_public_url(s3_key),
+                )
+                photo, photo_variants = photo_orm.photo, photo_orm.photo_variants
+
+            event_dal = EventsDAL(session)
+            created_event_orm = await event_dal.create_event(
+                title=cred.title,
+                text=cred.text,
+                author_id=cred.author_id,
+                photo=photo,
+                photo_variants=photo_variants,
+                photo_hash=content_hash,
+            )
+    except Exception:
+        # the rollback removed our photos row too
+        if uploaded:
+            await _discard_upload(content_hash, s3_key, session)
+        raise
+
+    if photo_created and not uploaded:
+        # the stored copy was released between the lookup and the insert
+        try:
+            await s3_client.put_file(s3_key=s3_key, file=uploaded_file.file)
+        except Exception:
+            # don't leave an event pointing at a missing object
+            async with session.begin():
+                event_dal = EventsDAL(session)
+                await event_dal.delete_event(event_id=created_event_orm.event_id)
+            await _release_photo(created_event_orm, session)
+            raise
 
     event_show_dto = EventShowDTO.model_validate(created_event_orm, from_attributes=True)
 
-    task = optimize_image_task.delay(event_id=event_show_dto.event_id, s3_key=s3_url_photo) 
-    print(f'Task name: {task}')
+    # only the first event with this content optimizes it; the worker updates
+    # every event sharing the hash
+    if photo_created:
+        task = optimize_image_task.delay(event_id=event_show_dto.event_id, s3_key=photo)
+        print(f'Task name: {task}')
 
-    if await redis_available():
-        keys = await redis_client.keys("events:page:*")
-        if keys:
-            await redis_client.delete(*keys)
+    await invalidate_feed_cache()
     return event_show_dto
 
 
 
 async def _delete_event(event_id, session) -> Optional[UUID]:
-    event = await _get_event_by_id(event_id=event_id, session=session)
-    filename = event.photo.split('/')[-1]
-
     async with session.begin():
-        await s3_client.delete_file(s3_key=filename)
-        
         event_dal = EventsDAL(session)
+        event = await event_dal.get_event_by_id(event_id=event_id)
         deleted_event_id = await event_dal.delete_event(event_id=event_id)
-    if await redis_available():
-        keys = await redis_client.keys("events:page:*")
-        if keys:
-            await redis_client.delete(*keys)
+    await invalidate_feed_cache(all_pages=True)
+
+    # storage is cleaned up only after the row is gone
+    if deleted_event_id is not None and event is not None:
+        await _release_photo(event, session)
     return deleted_event_id
 
+class UploadStorageUnavailable(Exception):
+    """ Redis or S3 failed, so an upload can't be issued or attached right now """
+    pass
+
+# keys handed out by _create_presigned_upload; anything else cannot be attached
+UPLOAD_KEY_REGEX = re.compile(r"^upload-[0-9a-f]{32}\.[a-z]+$")
+
+# every issued key is recorded for as long as its presigned POST is valid
+# and consumed by the first attach, so a key can't be attached twice
+def _issued_upload_key(s3_key: str) -> str:
+    return f"uploads:issued:{s3_key}"
+
+async def _create_presigned_upload(body: PresignedUploadRequest, user_id) -> PresignedUploadResponse:
+    s3_key = f"upload-{uuid.uuid4().hex}.{UPLOAD_CONTENT_TYPES[body.content_type]}"
+    if not redis_breaker.allow_request():
+        raise UploadStorageUnavailable()
+    try:
+        await redis_client.set(_issued_upload_key(s3_key), str(user_id), ex=settings.PRESIGNED_UPLOAD_EXPIRES)
+        redis_breaker.record_success()
+    except Exception as e:
+        print(f"Redis error (write): {e}")
+        redis_breaker.record_failure()
+        raise UploadStorageUnavailable() from e
+
+    presigned = await s3_client.generate_presigned_upload(
+        s3_key=s3_key,
+        content_type=body.content_type,
+        max_size=settings.UPLOAD_MAX_SIZE,
+        expires_in=settings.PRESIGNED_UPLOAD_EXPIRES,
+    )
+    return PresignedUploadResponse(
+        url=presigned["url"],
+        fields=presigned["fields"],
+        s3_key=s3_key,
+        expires_in=settings.PRESIGNED_UPLOAD_EXPIRES,
+    )
+
+async def _reissue_upload_key(s3_key: str, user_id):
+    """ Records a consumed key again so the attach can be retried, instead
+    of leaving its object orphaned """
+    try:
+        await redis_client.set(_issued_upload_key(s3_key), str(user_id), ex=settings.PRESIGNED_UPLOAD_EXPIRES)
+        redis_breaker.record_success()
+    except Exception as e:
+        print(f"Redis error (write): {e}")
+        redis_breaker.record_failure()
+
+async def _attach_uploaded_photo(event_id, s3_key: str, user_id, session) -> Optional[str]:
+    """ Attaches a directly uploaded object to the event and schedules its
+    optimization. Raises ValueError if the key was not issued to this user,
+    was already attached or the object is missing, UploadStorageUnavailable
+    if Redis or S3 fail; returns None if there is no such event. """
+    if not UPLOAD_KEY_REGEX.fullmatch(s3_key):
+        raise ValueError("Unknown upload key")
+    if not redis_breaker.allow_request():
+        raise UploadStorageUnavailable()
+    try:
+        issued_to = await redis_client.get(_issued_upload_key(s3_key))
+        redis_breaker.record_success()
+    except Exception as e:
+        print(f"Redis error (read): {e}")
+        redis_breaker.record_failure()
+        raise UploadStorageUnavailable() from e
+    if issued_to is None or issued_to.decode() != str(user_id):
+        raise ValueError("Unknown upload key")
+
+    try:
+        await s3_client.head_file(s3_key)
+    except FileNotFoundError:
+        # the key stays issued, the client may still finish the upload
+        raise ValueError("Uploaded object not found")
+    except Exception as e:
+        raise UploadStorageUnavailable() from e
+
+    photo_url = s3_client.get_public_url(s3_key)
+    consumed = False
+    try:
+        async with session.begin():
+            event_dal = EventsDAL(session)
+            event = await event_dal.get_event_by_id(event_id=event_id)
+            if event is None:
+                return None
+            # copy the old photo columns before the update refreshes the instance
+            old_photo = EventsOrm(
+                photo=event.photo,
+                photo_variants=event.photo_variants,
+                photo_hash=event.photo_hash,
+            )
+            await event_dal.update_photo(event_id=event_id, photo=photo_url)
+
+            # consumed last, so a failed check or update can be retried; only
+            # one attach wins, the others roll their update back
+            try:
+                consumed = await redis_client.getdel(_issued_upload_key(s3_key)) is not None
+            except Exception as e:
+                print(f"Redis error (write): {e}")
+                redis_breaker.record_failure()
+                raise UploadStorageUnavailable() from e
+            if not consumed:
+                raise ValueError("Upload key was already used")
+    except Exception:
+        if consumed:
+            # the commit failed after the key was consumed
+            await _reissue_upload_key(s3_key, user_id)
+        raise
+    await invalidate_feed_cache(all_pages=True)
+
+    if old_photo.photo is not None and old_photo.photo != photo_url:
+        await _release_photo(old_photo, session)
+
+    task = optimize_image_task.delay(event_id=event_id, s3_key=photo_url)
+    print(f'Task name: {task}')
+    return photo_url
+
 hit = 0
 miss = 0
 
 adapter = TypeAdapter(list[EventShowDTO])
 
-async def _get_events_limit_10_by_page(page: int, session) -> list[EventsOrm]:
+FEED_LOCK_TTL_MS = 5000
+FEED_FILL_WAIT_STEP = 0.05
+FEED_FILL_WAIT_STEPS = 40
+
+# cache key -> task currently loading it in this process
+_inflight: dict[str, asyncio.Task] = {}
+
+async def _single_flight(key: str, load: Callable[[], Awaitable[bytes]]) -> bytes:
+    """ Concurrent callers for the same key share one load() """
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(load())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield: a cancelled request must not cancel the load other callers wait on
+    return await asyncio.shield(task)
+
+async def _wait_for_fill(cache_key: str) -> Optional[bytes]:
+    for _ in range(FEED_FILL_WAIT_STEPS):
+        await asyncio.sleep(FEED_FILL_WAIT_STEP)
+        cached_data = await redis_client.get(cache_key)
+        if cached_data:
+            return cached_data
+    return None
+
+async def _fill_cache(cache_key: Optional[str], load: Callable[[], Awaitable[bytes]]) -> bytes:
+    """ Load and cache a page; only the worker holding the Redis lock hits the DB """
+    if cache_key is None:
+        return await load()
+
+    lock_key = f"{cache_key}:lock"
+    try:
+        acquired = await redis_client.set(lock_key, 1, nx=True, px=FEED_LOCK_TTL_MS)
+        if not acquired:
+            # another worker is refilling this key, wait for its result
+            cached_data = await _wait_for_fill(cache_key)
+            if cached_data:
+                return cached_data
+    except Exception as e:
+        print(f"Redis error (lock): {e}")
+        redis_breaker.record_failure()
+        acquired = False
+
+    try:
+        json_data = await load()
+        try:
+            await redis_client.set(cache_key, json_data, ex=FEED_CACHE_TTL)
+        except Exception as e:
+            print(f"Redis error (write): {e}")
+            redis_breaker.record_failure()
+        return json_data
+    finally:
+        if acquired:
+            try:
+                await redis_client.delete(lock_key)
+            except Exception as e:
+                print(f"Redis error (unlock): {e}")
+                redis_breaker.record_failure()
+
+async def _get_events_limit_10_by_page(page: int) -> bytes:
+    """ Returns the page as ready-to-send JSON bytes, straight from cache on a hit """
     global hit, miss
-    cache_key = f"events:page:{page}"
+    local_key = f"page:{page}"
+    cached_data = feed_head_cache.get(local_key)
+    if cached_data is not None:
+        return cached_data
+    generation = feed_head_cache.generation
+    cache_key = None
 
     try:
-        if await redis_available():
+        if redis_breaker.allow_request():
+            version = await get_feed_version(FEED_HEAD_VERSION_KEY)
+            cache_key = f"events:v{version}:page:{page}"
 
             cached_data = await redis_client.get(cache_key)
+            redis_breaker.record_success()
             
             if cached_data:
                 hit += 1
-                events_dto = adapter.validate_json(cached_data)
-                return [EventsOrm(**dto.model_dump()) for dto in events_dto]
+                feed_head_cache.put(local_key, cached_data, generation)
+                return cached_data
                 
     except Exception as e:
         print(f"Redis error (read): {e}")
+        redis_breaker.record_failure()
     miss += 1
-    start = 10 * (page - 1)
-    events_dal = EventsDAL(session)
-    events_orm_list = await events_dal.get_events_limit_10(offset=start)
-    
-    if not events_orm_list:
-        return []
-    if await redis_available():
-        asyncio.create_task(cache_page_data(cache_key, events_orm_list))
-
-    return events_orm_list
-
-async def cache_page_data(key: str, events_orm: list[EventsOrm]):
+
+    async def load() -> bytes:
+        start = 10 * (page - 1)
+        # the load is shared by every waiting request, so it can't borrow
+        # the session of the one that started it
+        async with async_session_factory() as session:
+            async with session.begin():
+                events_dal = EventsDAL(session)
+                events_orm_list = await events_dal.get_events_limit_10(offset=start)
+        events_dto = [EventShowDTO.model_validate(e, from_attributes=True) for e in events_orm_list]
+        return adapter.dump_json(events_dto)
+
+    data = await _single_flight(
+        cache_key or f"events:page:{page}",
+        lambda: _fill_cache(cache_key, load),
+    )
+    feed_head_cache.put(local_key, data, generation)
+    return data
+
+def encode_cursor(created_at: datetime.datetime, event_id: uuid.UUID) -> str:
+    raw = f"{created_at.isoformat()}|{event_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, uuid.UUID]:
+    # raises ValueError on anything that was not produced by encode_cursor
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    created_at, event_id = raw.split("|")
+    return datetime.datetime.fromisoformat(created_at), uuid.UUID(event_id)
+
+# A cached cursor page is "<next_cursor>\n<events json>" so a hit can be
+# split and sent without parsing the JSON.
+def _pack_feed_page(events_json: bytes, next_cursor: Optional[str]) -> bytes:
+    return (next_cursor or "").encode() + b"\n" + events_json
+
+def _unpack_feed_page(data: bytes) -> tuple[bytes, Optional[str]]:
+    next_cursor, _, events_json = data.partition(b"\n")
+    return events_json, next_cursor.decode() or None
+
+async def _get_events_by_cursor(cursor: Optional[str], limit: int) -> tuple[bytes, Optional[str]]:
+    """ Returns (events JSON bytes, next cursor) """
+    global hit, miss
+    created_at, event_id = decode_cursor(cursor) if cursor else (None, None)
+    local_cache = feed_tail_cache if cursor else feed_head_cache
+    local_key = f"cursor:{cursor or 'head'}:{limit}"
+    cached_data = local_cache.get(local_key)
+    if cached_data is not None:
+        return _unpack_feed_page(cached_data)
+    generation = local_cache.generation
+    cache_key = None
+
     try:
-        events_dto = [EventShowDTO.model_validate(e, from_attributes=True) for e in events_orm]
-        
-        json_data = adapter.dump_json(events_dto).decode('utf-8')
-        
-        await redis_client.set(key, json_data, ex=600)
-        
+        if redis_breaker.allow_request():
+            version = await get_feed_version(FEED_TAIL_VERSION_KEY if cursor else FEED_HEAD_VERSION_KEY)
+            cache_key = f"events:v{version}:cursor:{cursor or 'head'}:{limit}"
+
+            cached_data = await redis_client.get(cache_key)
+            redis_breaker.record_success()
+
+            if cached_data:
+                hit += 1
+                local_cache.put(local_key, cached_data, generation)
+                return _unpack_feed_page(cached_data)
+
     except Exception as e:
-        print(f"Redis error (write): {e}")
+        print(f"Redis error (read): {e}")
+        redis_breaker.record_failure()
+    miss += 1
+
+    async def load() -> bytes:
+        # own session, see _get_events_limit_10_by_page
+        async with async_session_factory() as session:
+            async with session.begin():
+                events_dal = EventsDAL(session)
+                # one extra row tells us whether there is a next page
+                events_orm_list = await events_dal.get_events_after_cursor(
+                    limit=limit + 1,
+                    created_at=created_at,
+                    event_id=event_id,
+                )
+
+        next_cursor = None
+        if len(events_orm_list) > limit:
+            events_orm_list = events_orm_list[:limit]
+            last = events_orm_list[-1]
+            next_cursor = encode_cursor(last.created_at, last.event_id)
+
+        events_dto = [EventShowDTO.model_validate(e, from_attributes=True) for e in events_orm_list]
+        return _pack_feed_page(adapter.dump_json(events_dto), next_cursor)
+
+    data = await _single_flight(
+        cache_key or f"events:cursor:{cursor or 'head'}:{limit}",
+        lambda: _fill_cache(cache_key, load),
+    )
+    local_cache.put(local_key, data, generation)
+    return _unpack_feed_page(data)
 
 async def _get_event_by_id(event_id, session) -> EventsOrm:
+    cache_key = str(event_id)
+    cached_data = event_local_cache.get(cache_key)
+    if cached_data is not None:
+        return EventsOrm(**EventShowDTO.model_validate_json(cached_data).model_dump())
+    generation = event_local_cache.generation
+
     async with session.begin():
         event_dal = EventsDAL(session)
-        return await event_dal.get_event_by_id(event_id=event_id)   
+        event = await event_dal.get_event_by_id(event_id=event_id)
+
+    if event is not None:
+        event_dto = EventShowDTO.model_validate(event, from_attributes=True)
+        event_local_cache.put(cache_key, event_dto.model_dump_json().encode(), generation)
+    return event   
 
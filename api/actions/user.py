@@ -5,15 +5,18 @@ from db.models.models import PortalRole, UsersOrm
 from typing import Optional
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
+from api.actions.auth import invalidate_principal
 
 async def _create_new_user(cred, session) -> UserShowDTO:
+    # hash before opening the transaction so no connection is held meanwhile
+    hashed_password = await Hasher.get_password_hash_async(cred.hashed_password)
     async with session.begin():
         user_dal = UserDAL(session)
 
         created_user_orm = await user_dal.create_user(
             name=cred.name,
             email=cred.email,
-            hashed_password=Hasher.get_password_hash(cred.hashed_password),
+            hashed_password=hashed_password,
             roles={PortalRole.ROLE_PORTAL_USER,}
         )
 
@@ -28,7 +31,8 @@ async def _delete_user(user_id, session) -> Optional[UUID]:
 
         deleted_user_id = await user_dal.delete_user(user_id=user_id)
 
-        return deleted_user_id
+    await invalidate_principal(user_id)
+    return deleted_user_id
     
 
 async def _update_user(user_id, updated_user_params: dict, session) -> Optional[UUID]:
@@ -36,7 +40,9 @@ async def _update_user(user_id, updated_user_params: dict, session) -> Optional[
         user_dal = UserDAL(session)
 
         updated_user_id = await user_dal.update_user(user_id=user_id, **updated_user_params)
-        return updated_user_id
+
+    await invalidate_principal(user_id)
+    return updated_user_id
     
     
 async def _get_user_by_id(user_id, session) -> UsersOrm:
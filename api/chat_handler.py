@@ -1,5 +1,6 @@
-from api.actions.chat import sio, Message
-from fastapi import APIRouter
+from api.actions.chat import sio, Message, _get_chat_history, get_chat_stats
+from fastapi import APIRouter, Query, HTTPException, status, Response
+from settings import settings
 
 
 
@@ -8,45 +9,27 @@ chat_router = APIRouter()
 
 
 @chat_router.get("/history")
-async def get_history(limit: int = 50):
-    messages = await Message.find_all().sort(-Message.created_at).limit(limit).to_list()
-    messages.reverse()
-    
-    return [
-        {
-            "id": str(m.id),
-            "sender_id": str(m.sender_id),
-            "sender_name": m.sender_name,
-            "text": m.text,
-            "created_at": m.created_at.isoformat()
-        }
-        for m in messages
-    ]
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+async def get_history(
+    limit: int = Query(settings.CHAT_HISTORY_PAGE_SIZE, ge=1, le=settings.CHAT_HISTORY_MAX_PAGE_SIZE),
+    before: str | None = None,
+    after: str | None = None,
+):
+    # older pages are requested with X-Before-Cursor, newer ones with X-After-Cursor;
+    # the page is already serialized JSON and is sent as is
+    try:
+        messages_json, before_cursor, after_cursor = await _get_chat_history(limit=limit, before=before, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    headers = {}
+    if before_cursor is not None:
+        headers["X-Before-Cursor"] = before_cursor
+    if after_cursor is not None:
+        headers["X-After-Cursor"] = after_cursor
+    return Response(content=messages_json, media_type="application/json", headers=headers)
+
+
+@chat_router.get("/stats")
+async def get_stats():
+    # counters of this process only
+    return get_chat_stats()
@@ -1,9 +1,10 @@
 from api.schemas import (UserAddDTO, UserShowDTO, DeleteUserResponse, 
                          UpdatedUserResponse, UpdateUserRequest, EventAddDTO, 
-                         EventShowDTO, DeleteEventResponse)
+                         EventShowDTO, DeleteEventResponse, PresignedUploadRequest,
+                         PresignedUploadResponse, AttachPhotoRequest, AttachPhotoResponse)
 from db.database import get_db
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import Depends, APIRouter, File, HTTPException, status, UploadFile
+from fastapi import Depends, APIRouter, File, HTTPException, status, UploadFile, Query, Response
 from sqlalchemy.exc import IntegrityError
 from logging import getLogger
 from api.actions.user import (_create_new_user, _delete_user, _get_user_by_email,
@@ -12,7 +13,11 @@ from api.actions.auth import get_current_user_from_token
 from sqlalchemy.dialects.postgresql import UUID 
 from db.models.models import UsersOrm, EventsOrm
 import uuid
-from api.actions.events import _create_new_event, _delete_event, _get_events_limit_10_by_page, _get_event_by_id
+from hashing import HashingPoolBusy, hashing_pool
+from api.actions.events import (_create_new_event, _delete_event, _get_events_limit_10_by_page, _get_event_by_id,
+_get_events_by_cursor, _create_presigned_upload, _attach_uploaded_photo, get_cache_stats,
+UploadStorageUnavailable)
+from settings import settings
 
 logger = getLogger(__name__)
 
@@ -34,6 +39,8 @@ async def create_user(
         except IntegrityError as err:
               logger.error(err)
               raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f'Database erroe: {err}')
+        except HashingPoolBusy:
+              raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many requests, try again later")
         
 @user_router.delete("/", response_model=DeleteUserResponse)
 async def delete_user(
@@ -42,7 +49,10 @@ async def delete_user(
        current_user: UsersOrm = Depends(get_current_user_from_token)
 ) -> DeleteUserResponse:
        # check for deletion and existence
-       user_for_deletion = await _get_user_by_id(user_id=user_id, session=db)
+       if current_user.user_id == user_id:
+              user_for_deletion = current_user
+       else:
+              user_for_deletion = await _get_user_by_id(user_id=user_id, session=db)
        if user_for_deletion is None:
               raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User with id {user_id} not found")
 
@@ -84,7 +94,10 @@ async def update_user(
                      detail="At least one parameter for user update info should be provided"
               )
        
-       user_for_update = await _get_user_by_id(user_id=user_id, session=db)
+       if current_user.user_id == user_id:
+              user_for_update = current_user
+       else:
+              user_for_update = await _get_user_by_id(user_id=user_id, session=db)
        if user_for_update is None:
               raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User with id {user_id} not found")
        
@@ -205,6 +218,39 @@ async def create_events(
               logger.error(err)
               raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f'Database erroe: {err}')
         
+@event_router.post("/photo/upload_url", response_model=PresignedUploadResponse)
+async def create_photo_upload_url(
+       body: PresignedUploadRequest,
+       current_user: UsersOrm = Depends(get_current_user_from_token)
+) -> PresignedUploadResponse:
+       # the browser POSTs the photo straight to storage, then calls /photo/complete
+       if not (current_user.is_admin or current_user.is_superadmin):
+              raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+       try:
+              return await _create_presigned_upload(body, user_id=current_user.user_id)
+       except UploadStorageUnavailable:
+              raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Upload storage unavailable, try again later")
+
+@event_router.post("/photo/complete", response_model=AttachPhotoResponse)
+async def complete_photo_upload(
+       body: AttachPhotoRequest,
+       db: AsyncSession = Depends(get_db),
+       current_user: UsersOrm = Depends(get_current_user_from_token)
+) -> AttachPhotoResponse:
+       if not (current_user.is_admin or current_user.is_superadmin):
+              raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+       try:
+              photo = await _attach_uploaded_photo(
+                     event_id=body.event_id, s3_key=body.s3_key, user_id=current_user.user_id, session=db
+              )
+       except ValueError as err:
+              raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
+       except UploadStorageUnavailable:
+              raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Upload storage unavailable, try again later")
+       if photo is None:
+              raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Event with id {body.event_id} not found")
+       return AttachPhotoResponse(event_id=body.event_id, photo=photo)
+
 @event_router.delete("/delete", response_model=DeleteEventResponse)
 async def delete_event(
        event_id: uuid.UUID,
@@ -229,11 +275,38 @@ async def delete_event(
 
 @event_router.get("/get", response_model=list[EventShowDTO])
 async def get_events_limit_10_by_page(
-       page: int,
-       db: AsyncSession = Depends(get_db)
-) -> list[EventShowDTO]:
-       events = await _get_events_limit_10_by_page(page=page, session=db)
-       if events is None:
-              raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Events not found")
-
-       return events
\ No newline at end of file
+       page: int | None = None,
+       cursor: str | None = None,
+       limit: int = Query(settings.EVENTS_PAGE_SIZE, ge=1, le=settings.EVENTS_MAX_PAGE_SIZE),
+) -> Response:
+       # pages come back as already serialized list[EventShowDTO] JSON,
+       # so they are sent as is instead of going through response_model
+       # legacy OFFSET paging for old clients
+       if page is not None:
+              events_json = await _get_events_limit_10_by_page(page=page)
+              return Response(content=events_json, media_type="application/json")
+
+       # keyset paging: next page is requested with the cursor from X-Next-Cursor
+       try:
+              events_json, next_cursor = await _get_events_by_cursor(cursor=cursor, limit=limit)
+       except ValueError:
+              raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+       headers = {"X-Next-Cursor": next_cursor} if next_cursor is not None else None
+       return Response(content=events_json, media_type="application/json", headers=headers)
+
+
+####################
+# Stats
+####################
+
+stats_router = APIRouter()
+
+
+@stats_router.get("/")
+async def get_stats() -> dict:
+       # counters of this process only
+       return {
+              "cache": get_cache_stats(),
+              # queue depth of the password hashing pool
+              "hashing": hashing_pool.stats(),
+       }
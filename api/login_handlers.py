@@ -6,13 +6,17 @@ from db.database import get_db
 from api.actions.auth import authenticate_user, config, security, get_current_user_from_token
 from db.models.models import UsersOrm
 from authx.exceptions import JWTDecodeError
+from hashing import HashingPoolBusy
 
 
 login_router = APIRouter()
 
 @login_router.post("/token", response_model=Token)
 async def login(response: Response, form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)) -> Token:
-    user = await authenticate_user(email=form_data.username, password=form_data.password, session=db)
+    try:
+        user = await authenticate_user(email=form_data.username, password=form_data.password, session=db)
+    except HashingPoolBusy:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many login attempts, try again later")
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="incorrect username or pass")
     
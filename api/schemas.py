@@ -27,6 +27,14 @@ class UserShowDTO(UserAddDTO):
     created_at: datetime
     roles: list[PortalRole]
 
+class UserPrincipalDTO(BaseModel):
+    """ Cached identity of an authenticated user, without the password hash """
+    user_id: uuid.UUID
+    name: str
+    email: str
+    created_at: datetime
+    roles: list[PortalRole]
+
 class DeleteUserResponse(BaseModel):
     deleted_user_id: uuid.UUID  
 
@@ -76,15 +84,55 @@ class EventAddDTO(BaseModel):
              author_id=author_id,        
             )
 
+class PhotoVariantDTO(BaseModel):
+    width: int
+    height: int
+    urls: dict[str, str]
+
 class EventShowDTO(EventAddDTO):
     event_id: uuid.UUID
     photo: str | None
+    photo_variants: dict[str, PhotoVariantDTO] | None = None
     likes: int 
     created_at: datetime
     updated_at: datetime
 
 class DeleteEventResponse(BaseModel):
-    deleted_event_id: uuid.UUID     
+    deleted_event_id: uuid.UUID
+
+# content types accepted for direct uploads -> extension of the stored object
+UPLOAD_CONTENT_TYPES = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/heic": "heic",
+    "image/heif": "heif",
+}
+
+class PresignedUploadRequest(BaseModel):
+    content_type: str
+
+    @field_validator("content_type")
+    def validate_content_type(cls, value: str):
+        if value not in UPLOAD_CONTENT_TYPES:
+            raise ValueError(
+                f"Content type should be one of: {', '.join(UPLOAD_CONTENT_TYPES)}"
+            )
+        return value
+
+class PresignedUploadResponse(BaseModel):
+    url: str
+    fields: dict[str, str]
+    s3_key: str
+    expires_in: int
+
+class AttachPhotoRequest(BaseModel):
+    event_id: uuid.UUID
+    s3_key: str
+
+class AttachPhotoResponse(BaseModel):
+    event_id: uuid.UUID
+    photo: str     
 
 
 
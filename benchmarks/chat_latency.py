@@ -0,0 +1,123 @@
+"""Measures end-to-end chat broadcast latency across server processes.
+
+    python -m benchmarks.chat_latency --token <access token> --url http://localhost:8000 --url http://localhost:8001 --receivers 8 --messages 200
+
+Starts --receivers client processes, spread round-robin over the given
+server URLs, plus one sender on the first URL. The sender emits --messages
+chat messages stamped with their send time, and every receiver records how
+long each one took to arrive. A receiver connected to a different server
+process than the sender only gets the message through CHAT_MANAGER. That
+applies to several --url values and to several uvicorn workers behind one
+URL. So lost deliveries are reported next to the latency percentiles.
+
+All clients connect with the given access token (see /login/token). The
+chat rate limits apply to the sender, so raise CHAT_RATE_PER_SID and
+CHAT_RATE_PER_SENDER (or raise --interval) for fast runs.
+
+Latencies compare wall clocks of different processes: run all clients on one
+host. The messages are stored like any other chat message, so point it at a
+test deployment.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import queue
+import time
+import socketio
+from benchmarks.common import percentile
+
+
+BENCH_PREFIX = "latency-bench"
+
+
+async def _receive(url: str, token: str, expected: int, timeout: float, ready, results):
+    client = socketio.AsyncClient()
+    latencies = []
+    done = asyncio.Event()
+
+    @client.on("new_message")
+    async def on_message(msg):
+        parts = msg.get("text", "").split()
+        if len(parts) != 3 or parts[0] != BENCH_PREFIX:
+            return
+        latencies.append(time.time() - float(parts[2]))
+        if len(latencies) >= expected:
+            done.set()
+
+    await client.connect(url, transports=["websocket"], auth={"token": token})
+    ready.put(url)
+    try:
+        await asyncio.wait_for(done.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        await client.disconnect()
+        results.put(latencies)
+
+
+def _receiver(url: str, token: str, expected: int, timeout: float, ready, results):
+    asyncio.run(_receive(url, token, expected, timeout, ready, results))
+
+
+async def _send(url: str, token: str, messages: int, interval: float):
+    client = socketio.AsyncClient()
+    await client.connect(url, transports=["websocket"], auth={"token": token})
+    try:
+        for seq in range(messages):
+            await client.emit("message", {"text": f"{BENCH_PREFIX} {seq} {time.time()}"})
+            await asyncio.sleep(interval)
+    finally:
+        await client.disconnect()
+
+
+def run(urls: list[str], token: str, receivers: int, messages: int, interval: float, timeout: float):
+    ctx = multiprocessing.get_context("spawn")
+    # receivers wait for the whole send plus the timeout for stragglers
+    receive_timeout = timeout + messages * interval
+    ready = ctx.Queue()
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=_receiver, args=(urls[i % len(urls)], token, messages, receive_timeout, ready, results))
+        for i in range(receivers)
+    ]
+    for process in processes:
+        process.start()
+
+    for _ in processes:
+        ready.get(timeout=timeout)
+
+    asyncio.run(_send(urls[0], token, messages, interval))
+
+    latencies = []
+    for _ in processes:
+        try:
+            latencies.extend(results.get(timeout=receive_timeout + timeout))
+        except queue.Empty:
+            break
+    for process in processes:
+        process.join(timeout=1)
+        if process.is_alive():
+            process.terminate()
+
+    expected = receivers * messages
+    print(f"delivered {len(latencies)}/{expected} messages to {receivers} receivers on {len(urls)} url(s)")
+    if latencies:
+        print(
+            f"latency ms: p50={percentile(latencies, 0.5) * 1000:.1f} "
+            f"p95={percentile(latencies, 0.95) * 1000:.1f} "
+            f"p99={percentile(latencies, 0.99) * 1000:.1f} "
+            f"max={max(latencies) * 1000:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure chat broadcast latency across server processes")
+    parser.add_argument("--url", action="append", required=True, help="server URL, repeat for several processes / nodes")
+    parser.add_argument("--token", required=True, help="access token the clients connect with")
+    parser.add_argument("--receivers", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between sent messages")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    run(args.url, args.token, args.receivers, args.messages, args.interval, args.timeout)
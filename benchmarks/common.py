@@ -0,0 +1,50 @@
+""" Helpers shared by the benchmark scripts and tests """
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator
+from PIL import Image
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def synthetic_photo(width: int, height: int) -> Image.Image:
+    # noise over gradients compresses and decodes roughly like a photo
+    return Image.merge("RGB", (
+        Image.linear_gradient("L").resize((width, height)),
+        Image.effect_noise((width, height), 64),
+        Image.radial_gradient("L").resize((width, height)),
+    ))
+
+
+@contextmanager
+def moto_server() -> Iterator[str]:
+    """ moto's S3 stand-in in its own process, so the objects it keeps in
+    memory don't count against the client's; yields its endpoint URL """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen(
+        [sys.executable, "-m", "moto.server", "-H", "127.0.0.1", "-p", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline or server.poll() is not None:
+                    raise RuntimeError("moto server did not start")
+                time.sleep(0.1)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.terminate()
+        server.wait()
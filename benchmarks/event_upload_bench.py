@@ -0,0 +1,124 @@
+"""Compares event creation with the photo uploaded inside and outside the DB transaction.
+
+    python -m benchmarks.event_upload_bench --author-id <uuid> --events 200 --concurrency 50 --pool-size 5
+
+Runs against the configured Postgres and S3, with its own engine of
+--pool-size connections. Creates --events events with a --photo-kb photo
+from --concurrency tasks, two ways:
+
+* inside: checks out a connection as the transaction begins, then
+  put_file, then the INSERT (the old order, a pooled connection is held for
+  the whole upload).
+* outside: put_file first, then a transaction for the INSERT only (what
+  _create_new_event does now).
+
+Prints events/sec and p50/p99 per event for each, plus p50/p99 of the wait
+for a pooled connection and of how long each connection was held (pool
+checkout to checkin). The events and objects it creates are deleted
+afterwards, so point it at a test deployment.
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from db.dals import EventsDAL
+from services.s3_service import s3_client
+from settings import settings
+from benchmarks.common import percentile
+
+
+def _track_hold_times(engine, hold_times: list):
+    """ Appends checkout-to-checkin seconds of every pooled connection """
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.perf_counter()
+
+    def on_checkin(dbapi_connection, connection_record):
+        checked_out_at = connection_record.info.pop("checked_out_at", None)
+        if checked_out_at is not None:
+            hold_times.append(time.perf_counter() - checked_out_at)
+
+    event.listen(engine.sync_engine, "checkout", on_checkout)
+    event.listen(engine.sync_engine, "checkin", on_checkin)
+
+
+async def _checkout(session, waits: list):
+    # begin() is lazy, the connection is only taken from the pool here
+    started = time.perf_counter()
+    await session.connection()
+    waits.append(time.perf_counter() - started)
+
+
+async def _create(session_factory, author_id: uuid.UUID, photo: bytes, inside: bool, created: list, waits: list) -> float:
+    s3_key = f"event-upload-bench-{uuid.uuid4().hex}.jpg"
+    started = time.perf_counter()
+    async with session_factory() as session:
+        if inside:
+            async with session.begin():
+                await _checkout(session, waits)
+                url = await s3_client.put_file(s3_key=s3_key, file=photo)
+                created_event = await EventsDAL(session).create_event(title="upload-bench", text="", author_id=author_id, photo=url)
+        else:
+            url = await s3_client.put_file(s3_key=s3_key, file=photo)
+            async with session.begin():
+                await _checkout(session, waits)
+                created_event = await EventsDAL(session).create_event(title="upload-bench", text="", author_id=author_id, photo=url)
+    created.append((created_event.event_id, s3_key))
+    return time.perf_counter() - started
+
+
+async def _run(session_factory, author_id, photo: bytes, events: int, concurrency: int, inside: bool, created: list):
+    latencies = []
+    waits = []
+    counter = iter(range(events))
+
+    async def worker():
+        for _ in counter:
+            latencies.append(await _create(session_factory, author_id, photo, inside, created, waits))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return events / (time.perf_counter() - started), latencies, waits
+
+
+async def main(author_id: uuid.UUID, events: int, concurrency: int, pool_size: int, photo_kb: int):
+    engine = create_async_engine(settings.DATABASE_ASYNC_URL, pool_size=pool_size, max_overflow=0)
+    session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+    hold_times = []
+    _track_hold_times(engine, hold_times)
+    photo = os.urandom(photo_kb * 1024)
+    created = []
+    await s3_client.start()
+    try:
+        for name, inside in (("inside txn", True), ("outside txn", False)):
+            hold_times.clear()
+            rate, latencies, waits = await _run(session_factory, author_id, photo, events, concurrency, inside, created)
+            print(
+                f"{name:<11}: {rate:7.1f} events/sec, "
+                f"p50={percentile(latencies, 0.5) * 1000:.1f} ms p99={percentile(latencies, 0.99) * 1000:.1f} ms, "
+                f"pool wait p50={percentile(waits, 0.5) * 1000:.1f} ms p99={percentile(waits, 0.99) * 1000:.1f} ms, "
+                f"held p50={percentile(hold_times, 0.5) * 1000:.1f} ms p99={percentile(hold_times, 0.99) * 1000:.1f} ms"
+            )
+    finally:
+        async with session_factory() as session:
+            async with session.begin():
+                event_dal = EventsDAL(session)
+                for event_id, _ in created:
+                    await event_dal.delete_event(event_id=event_id)
+        await asyncio.gather(*(s3_client.delete_file(s3_key=s3_key) for _, s3_key in created), return_exceptions=True)
+        await s3_client.close()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark uploads inside vs outside the event transaction")
+    parser.add_argument("--author-id", type=uuid.UUID, required=True, help="existing user the events are created for")
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--pool-size", type=int, default=5)
+    parser.add_argument("--photo-kb", type=int, default=512)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.author_id, args.events, args.concurrency, args.pool_size, args.photo_kb))
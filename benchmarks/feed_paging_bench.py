@@ -0,0 +1,125 @@
+"""Compares OFFSET and keyset (cursor) feed pages at increasing depth.
+
+    python -m benchmarks.feed_paging_bench --depths 0 1000 10000 100000 --rounds 20
+    python -m benchmarks.feed_paging_bench --seed 1000000 --depths 0 10000 100000 990000
+
+Runs against the configured database. For every --depths value below the
+number of events, it times the legacy page query (get_events_limit_10 with
+that OFFSET) and the cursor query that returns the same page
+(get_events_after_cursor after the row just above it). Prints the median ms
+of each.
+
+With --seed N it first bulk-inserts N synthetic events (one INSERT ...
+SELECT over generate_series) for a throwaway user, and deletes them and the
+user afterwards, so point it at a test database. Without it, only the
+events already there are read.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from sqlalchemy import select, func, delete, text
+from db.dals import EventsDAL, UserDAL
+from db.database import async_session_factory, engine
+from db.models.models import EventsOrm, PortalRole
+
+
+SEED_NAME = "paging-bench"
+
+
+async def _seed(rows: int) -> uuid.UUID:
+    """ Inserts `rows` events one second apart for a new user; returns its id """
+    async with async_session_factory() as session:
+        async with session.begin():
+            author = await UserDAL(session).create_user(
+                name=SEED_NAME,
+                email=f"{SEED_NAME}-{uuid.uuid4().hex}@example.invalid",
+                hashed_password="!",
+                roles=[PortalRole.ROLE_PORTAL_USER],
+            )
+            await session.execute(
+                text(
+                    "INSERT INTO events (event_id, title, text, author_id, likes, created_at, updated_at) "
+                    "SELECT gen_random_uuid(), CAST(:title AS varchar), '', CAST(:author_id AS uuid), 0, "
+                    "now() - g * interval '1 second', now() - g * interval '1 second' "
+                    "FROM generate_series(1, CAST(:rows AS integer)) AS g"
+                ),
+                {"title": SEED_NAME, "author_id": author.user_id, "rows": rows},
+            )
+        # fresh statistics, so the planner sees the new rows
+        async with session.begin():
+            await session.execute(text("ANALYZE events"))
+    return author.user_id
+
+
+async def _unseed(author_id: uuid.UUID):
+    async with async_session_factory() as session:
+        async with session.begin():
+            await session.execute(delete(EventsOrm).where(EventsOrm.author_id==author_id))
+            await UserDAL(session).delete_user(user_id=author_id)
+
+
+async def _median_ms(query, rounds: int) -> float:
+    timings = []
+    for _ in range(rounds):
+        async with async_session_factory() as session:
+            async with session.begin():
+                started = time.perf_counter()
+                await query(EventsDAL(session))
+                timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+async def main(depths: list[int], rounds: int, seed: int):
+    author_id = None
+    try:
+        if seed:
+            author_id = await _seed(seed)
+            print(f"seeded {seed} events")
+
+        async with async_session_factory() as session:
+            total = await session.scalar(select(func.count()).select_from(EventsOrm))
+        print(f"{total} events")
+
+        for depth in depths:
+            if depth >= total:
+                print(f"depth {depth}: skipped, only {total} events")
+                continue
+
+            cursor = None
+            if depth > 0:
+                async with async_session_factory() as session:
+                    # the last row of the previous page, in cursor order
+                    row = (await session.execute(
+                        select(EventsOrm.created_at, EventsOrm.event_id)
+                        .order_by(EventsOrm.created_at.desc(), EventsOrm.event_id.desc())
+                        .offset(depth - 1)
+                        .limit(1)
+                    )).one()
+                cursor = (row.created_at, row.event_id)
+
+            offset_ms = await _median_ms(lambda dal: dal.get_events_limit_10(offset=depth), rounds)
+            keyset_ms = await _median_ms(
+                lambda dal: dal.get_events_after_cursor(
+                    limit=10,
+                    created_at=cursor[0] if cursor else None,
+                    event_id=cursor[1] if cursor else None,
+                ),
+                rounds,
+            )
+            print(f"depth {depth:>8}: offset {offset_ms:8.2f} ms, cursor {keyset_ms:8.2f} ms")
+    finally:
+        if author_id is not None:
+            await _unseed(author_id)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark OFFSET vs cursor feed pages")
+    parser.add_argument("--depths", type=int, nargs="+", default=[0, 1000, 10000, 100000])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0, help="synthetic events to insert first and remove afterwards")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.depths, args.rounds, args.seed))
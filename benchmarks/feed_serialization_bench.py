@@ -0,0 +1,92 @@
+"""Compares serving a cached feed page as raw bytes with the old validate+rebuild path.
+
+    python -m benchmarks.feed_serialization_bench --page-sizes 10 50 --rounds 2000
+
+Builds feed pages of generated events, dumped like the cache stores them.
+Then it times two ways of turning a cached page into a response body:
+
+* rebuild (the old hit path): validate the JSON into EventShowDTO, turn that
+  into EventsOrm, then let response_model validate it from attributes again
+  and serialize it through JSONResponse.
+* raw: send the cached bytes as they are, the way the handler does now.
+
+Prints microseconds per page and pages per second for each page size. It
+needs no database or Redis.
+"""
+import argparse
+import datetime
+import time
+import uuid
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from api.actions.events import adapter
+from api.schemas import EventShowDTO
+from db.models.models import EventsOrm
+
+
+def _event(seq: int) -> EventShowDTO:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    event_id = uuid.uuid4()
+    return EventShowDTO(
+        event_id=event_id,
+        title=f"Event {seq}",
+        text="Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4,
+        author_id=uuid.uuid4(),
+        photo=f"https://static.example/optimized_{event_id}_full.webp",
+        photo_variants={
+            name: {
+                "width": width,
+                "height": height,
+                "urls": {
+                    image_format: f"https://static.example/optimized_{event_id}_{name}.{image_format}"
+                    for image_format in ("webp", "jpg")
+                },
+            }
+            for name, (width, height) in {"thumbnail": (320, 240), "medium": (960, 720), "full": (1440, 1080)}.items()
+        },
+        likes=seq,
+        created_at=now,
+        updated_at=now,
+    )
+
+
+def _rebuild(cached: bytes) -> bytes:
+    events_dto = adapter.validate_json(cached)
+    events_orm = [EventsOrm(**dto.model_dump()) for dto in events_dto]
+    # what response_model did with the returned ORM objects
+    validated = adapter.validate_python(events_orm, from_attributes=True)
+    return JSONResponse(content=adapter.dump_python(validated, mode="json")).body
+
+
+def _raw(cached: bytes) -> bytes:
+    return Response(content=cached, media_type="application/json").body
+
+
+def _time_per_page(render, cached: bytes, rounds: int) -> float:
+    render(cached)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        render(cached)
+    return (time.perf_counter() - started) / rounds
+
+
+def run(page_sizes: list[int], rounds: int):
+    for page_size in page_sizes:
+        cached = adapter.dump_json([_event(seq) for seq in range(page_size)])
+        rebuild = _time_per_page(_rebuild, cached, rounds)
+        raw = _time_per_page(_raw, cached, rounds)
+        print(
+            f"{page_size:>3} events ({len(cached) / 1024:.1f} KiB): "
+            f"rebuild {rebuild * 1e6:8.1f} us/page ({1 / rebuild:8.0f}/s), "
+            f"raw {raw * 1e6:6.1f} us/page ({1 / raw:8.0f}/s), "
+            f"{rebuild / raw:.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark cached feed page serialization")
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    run(args.page_sizes, args.rounds)
@@ -0,0 +1,63 @@
+"""Shows how many feed loads a burst of concurrent cache misses causes, with and without single-flight.
+
+    python -m benchmarks.feed_single_flight_bench --requests 200 --query-ms 50
+
+Fires --requests concurrent misses for the same feed page. The load is a
+stand-in that sleeps --query-ms (the page query) and counts how often it
+ran. Above 10 concurrent loads it sleeps proportionally longer, a crude
+model of a saturated connection pool. Without single-flight every request
+runs its own load; with it, _single_flight shares one load per process.
+Prints the loads and the p50/p99 request latency of each. It needs no
+database or Redis; the Redis lock in _fill_cache, which coalesces across
+processes, is not exercised.
+"""
+import argparse
+import asyncio
+import time
+from api.actions.events import _single_flight
+from benchmarks.common import percentile
+
+
+async def _burst(requests: int, query_ms: float, coalesce: bool) -> tuple[int, list[float]]:
+    loads = 0
+    # a database that slows down as concurrent queries pile up
+    in_flight = 0
+
+    async def load() -> bytes:
+        nonlocal loads, in_flight
+        loads += 1
+        in_flight += 1
+        try:
+            await asyncio.sleep(query_ms / 1000 * max(1.0, in_flight / 10))
+        finally:
+            in_flight -= 1
+        return b"[]"
+
+    async def request() -> float:
+        started = time.perf_counter()
+        if coalesce:
+            await _single_flight("events:v0:page:1", load)
+        else:
+            await load()
+        return time.perf_counter() - started
+
+    latencies = await asyncio.gather(*(request() for _ in range(requests)))
+    return loads, latencies
+
+
+async def main(requests: int, query_ms: float):
+    for coalesce in (False, True):
+        loads, latencies = await _burst(requests, query_ms, coalesce)
+        print(
+            f"{'single-flight' if coalesce else 'no coalescing':<14}: {loads:>4} loads for {requests} requests, "
+            f"p50={percentile(latencies, 0.5) * 1000:.1f} ms p99={percentile(latencies, 0.99) * 1000:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark single-flight feed cache refills")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--query-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.requests, args.query_ms))
@@ -0,0 +1,117 @@
+"""Measures the resize worker's rendering over a corpus of images, with and without the fast decode path.
+
+    python -m benchmarks.image_decode_bench --corpus ./photos --rounds 3
+
+Renders every configured variant and format for each image in --corpus
+(default: generated 12/24/48MP JPEGs, 12/48MP PNGs and a 12MP HEIC), in two
+ways:
+
+* full: decode the whole original, then render_variants.
+* fast: decode_for_box (draft for JPEG, reduce for the rest), then
+  render_variants, as the worker does.
+
+Each (image, mode) runs in a fresh process and reports its peak RSS above
+the process baseline (Linux only: reads /proc/self/status). Prints ms/image
+and peak MiB per image and the totals.
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+from services.resize_images import decode_for_box, render_variants
+from benchmarks.common import synthetic_photo
+from settings import settings
+
+
+FIXTURES = {
+    "jpeg-12mp.jpg": ((4000, 3000), "JPEG"),
+    "jpeg-24mp.jpg": ((6000, 4000), "JPEG"),
+    "jpeg-48mp.jpg": ((8000, 6000), "JPEG"),
+    "png-12mp.png": ((4000, 3000), "PNG"),
+    "png-48mp.png": ((8000, 6000), "PNG"),
+    "heic-12mp.heic": ((4000, 3000), "HEIF"),
+}
+
+
+def _write_fixtures(directory: str) -> list[str]:
+    paths = []
+    for name, ((width, height), image_format) in FIXTURES.items():
+        path = os.path.join(directory, name)
+        synthetic_photo(width, height).save(path, format=image_format)
+        paths.append(path)
+    return paths
+
+
+def _status_mib(field: str) -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    raise RuntimeError(f"no {field} in /proc/self/status")
+
+
+def _reset_peak_rss():
+    # ru_maxrss survives fork+exec, the high-water mark can be reset instead (Linux)
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def _render(path: str, mode: str):
+    largest_box = max(settings.IMAGE_VARIANTS.values(), key=lambda size: size[0] * size[1])
+    with open(path, "rb") as original:
+        if mode == "fast":
+            img = decode_for_box(original, largest_box)
+        else:
+            img = ImageOps.exif_transpose(Image.open(original)).convert("RGB")
+        render_variants(img, settings.IMAGE_VARIANTS, settings.IMAGE_VARIANT_FORMATS)
+
+
+def _measure(path: str, mode: str, rounds: int) -> tuple[float, float]:
+    """ Runs in its own process: (ms per image, peak MiB above baseline) """
+    _reset_peak_rss()
+    baseline = _status_mib("VmRSS")
+    started = time.perf_counter()
+    for _ in range(rounds):
+        _render(path, mode)
+    elapsed_ms = (time.perf_counter() - started) / rounds * 1000
+    return elapsed_ms, _status_mib("VmHWM") - baseline
+
+
+def run(paths: list[str], rounds: int):
+    ctx = multiprocessing.get_context("spawn")
+    totals = {"full": [0.0, 0.0], "fast": [0.0, 0.0]}
+    print(f"{'image':<24} {'full ms':>9} {'full MiB':>9} {'fast ms':>9} {'fast MiB':>9}")
+    for path in paths:
+        row = {}
+        for mode in ("full", "fast"):
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+                row[mode] = executor.submit(_measure, path, mode, rounds).result()
+            totals[mode][0] += row[mode][0]
+            totals[mode][1] = max(totals[mode][1], row[mode][1])
+        print(
+            f"{os.path.basename(path):<24} "
+            f"{row['full'][0]:>9.1f} {row['full'][1]:>9.1f} {row['fast'][0]:>9.1f} {row['fast'][1]:>9.1f}"
+        )
+
+    count = len(paths)
+    print(
+        f"mean ms/image: full {totals['full'][0] / count:.1f}, fast {totals['fast'][0] / count:.1f} "
+        f"({totals['full'][0] / totals['fast'][0]:.1f}x); "
+        f"max peak MiB: full {totals['full'][1]:.1f}, fast {totals['fast'][1]:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark image decoding over a corpus")
+    parser.add_argument("--corpus", help="directory of images; a generated fixture set by default")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.corpus:
+        run(sorted(os.path.join(args.corpus, name) for name in os.listdir(args.corpus)), args.rounds)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            run(_write_fixtures(directory), args.rounds)
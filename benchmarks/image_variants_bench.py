@@ -0,0 +1,80 @@
+"""Compares rendering all variants from one decode with decoding per variant.
+
+    python -m benchmarks.image_variants_bench --size 4000x3000 --rounds 5
+
+Generates a noisy JPEG of --size (or use --image), then times two ways of
+producing every IMAGE_VARIANTS size in every IMAGE_VARIANT_FORMATS format:
+
+* per-variant: decode the full original again for each variant and resize
+  it from full size.
+* decode-once: decode it once and render the variants largest first, each
+  from the previous one (render_variants, as the worker does).
+
+Both do a full decode, without draft/reduce, so only the decode-once
+cascade is compared. Prints ms per image for each.
+"""
+import argparse
+import io
+import time
+from PIL import Image, ImageOps
+from services.resize_images import render_variants, _encode
+from benchmarks.common import synthetic_photo
+from settings import settings
+
+
+def _generated_jpeg(width: int, height: int) -> bytes:
+    output = io.BytesIO()
+    synthetic_photo(width, height).save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+def _decode(original: bytes) -> Image.Image:
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(original)))
+    return img.convert("RGB")
+
+
+def per_variant(original: bytes) -> int:
+    encoded = 0
+    for size in settings.IMAGE_VARIANTS.values():
+        img = _decode(original)
+        img.thumbnail(size, Image.Resampling.LANCZOS)
+        for image_format in settings.IMAGE_VARIANT_FORMATS:
+            encoded += len(_encode(img, image_format).getbuffer())
+    return encoded
+
+
+def decode_once(original: bytes) -> int:
+    rendered = render_variants(_decode(original), settings.IMAGE_VARIANTS, settings.IMAGE_VARIANT_FORMATS)
+    return sum(len(output.getbuffer()) for variant in rendered.values() for output in variant["files"].values())
+
+
+def _ms_per_image(render, original: bytes, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        render(original)
+    return (time.perf_counter() - started) / rounds * 1000
+
+
+def run(original: bytes, rounds: int):
+    with Image.open(io.BytesIO(original)) as img:
+        print(f"{img.format} {img.width}x{img.height}, variants {dict(settings.IMAGE_VARIANTS)}, formats {settings.IMAGE_VARIANT_FORMATS}")
+    separate = _ms_per_image(per_variant, original, rounds)
+    once = _ms_per_image(decode_once, original, rounds)
+    print(f"per-variant decode: {separate:7.1f} ms/image")
+    print(f"decode once:        {once:7.1f} ms/image ({separate / once:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark decode-once variant rendering")
+    parser.add_argument("--image", help="image file to use instead of a generated JPEG")
+    parser.add_argument("--size", default="4000x3000", help="WIDTHxHEIGHT of the generated JPEG")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            original = f.read()
+    else:
+        width, height = (int(value) for value in args.size.split("x"))
+        original = _generated_jpeg(width, height)
+    run(original, args.rounds)
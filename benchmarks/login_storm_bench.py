@@ -0,0 +1,70 @@
+"""Measures event loop lag during a burst of logins, hashing inline vs in HashingPool.
+
+    python -m benchmarks.login_storm_bench --logins 32
+
+Verifies --logins passwords concurrently with the configured Argon2
+parameters: first by calling Hasher.verify_password on the event loop (the
+old login path), then through Hasher.verify_password_async. Meanwhile a
+ticker sleeps 10 ms at a time and records how late it wakes up. That lag is
+what every other request on the worker waits. Prints logins/sec and the
+p50/p99/max lag of each.
+"""
+import argparse
+import asyncio
+import time
+from hashing import Hasher, hashing_pool
+from benchmarks.common import percentile
+
+
+TICK = 0.01
+
+
+async def _ticker(lags: list[float], stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(TICK)
+        lags.append(loop.time() - started - TICK)
+
+
+async def _storm(logins: int, hashed_password: str, verify) -> tuple[float, list[float]]:
+    lags = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(lags, stop))
+    await asyncio.sleep(TICK)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(verify(hashed_password) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await ticker
+    return logins / elapsed, lags
+
+
+async def _verify_inline(hashed_password: str):
+    Hasher.verify_password(hashed_password=hashed_password, plain_password="storm-password")
+
+
+async def _verify_pooled(hashed_password: str):
+    await Hasher.verify_password_async(hashed_password=hashed_password, plain_password="storm-password")
+
+
+async def main(logins: int):
+    hashed_password = Hasher.get_password_hash("storm-password")
+    for name, verify in (("inline", _verify_inline), ("hashing pool", _verify_pooled)):
+        rate, lags = await _storm(logins, hashed_password, verify)
+        print(
+            f"{name:<12}: {rate:6.1f} logins/sec, loop lag "
+            f"p50={percentile(lags, 0.5) * 1000:.1f} ms p99={percentile(lags, 0.99) * 1000:.1f} ms "
+            f"max={max(lags) * 1000:.1f} ms"
+        )
+    print(f"pool stats: {hashing_pool.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark event loop lag during a login burst")
+    parser.add_argument("--logins", type=int, default=32)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.logins))
@@ -0,0 +1,67 @@
+"""Compares resolving an authenticated user from the database and from the principal cache.
+
+    python -m benchmarks.principal_cache_bench --user-id <uuid> --lookups 2000 --concurrency 50
+
+Runs against the configured Postgres and Redis. Resolves --user-id
+--lookups times from --concurrency tasks, first with the users SELECT every
+request used to run, then through _get_principal with a warm cache. Prints
+lookups/sec and p50/p99 of each. The user's cache entry is invalidated
+before and after.
+"""
+import argparse
+import asyncio
+import time
+from api.actions.auth import _get_principal, _get_user_by_id_for_auth, invalidate_principal
+from db.database import async_session_factory, engine
+from services.redis_service import redis_pool
+from benchmarks.common import percentile
+
+
+async def _run(lookup, lookups: int, concurrency: int) -> tuple[float, list[float]]:
+    latencies = []
+    counter = iter(range(lookups))
+
+    async def worker():
+        for _ in counter:
+            async with async_session_factory() as session:
+                started = time.perf_counter()
+                user = await lookup(session)
+                latencies.append(time.perf_counter() - started)
+            if user is None:
+                raise SystemExit("no such user")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return lookups / (time.perf_counter() - started), latencies
+
+
+async def main(user_id: str, lookups: int, concurrency: int):
+    await invalidate_principal(user_id)
+    try:
+        results = {
+            "database": await _run(lambda session: _get_user_by_id_for_auth(user_id, session=session), lookups, concurrency),
+        }
+        # the first lookup fills the cache
+        async with async_session_factory() as session:
+            await _get_principal(user_id, session=session)
+        results["cache"] = await _run(lambda session: _get_principal(user_id, session=session), lookups, concurrency)
+    finally:
+        await invalidate_principal(user_id)
+        await engine.dispose()
+        await redis_pool.disconnect()
+
+    for name, (rate, latencies) in results.items():
+        print(
+            f"{name:<8}: {rate:8.0f} lookups/sec, "
+            f"p50={percentile(latencies, 0.5) * 1000:.2f} ms p99={percentile(latencies, 0.99) * 1000:.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark authenticated user lookups")
+    parser.add_argument("--user-id", required=True)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.user_id, args.lookups, args.concurrency))
@@ -0,0 +1,80 @@
+"""Compares S3 operation latency with the long-lived pooled client and with a client per operation.
+
+    python -m benchmarks.s3_client_bench --ops 500 --concurrency 20
+    python -m benchmarks.s3_client_bench --endpoint http://localhost:9000 --bucket bench
+
+Runs --ops small put_file + head_file pairs from --concurrency tasks, first
+through an S3Client that is not started (a new client, and so new
+connections, per operation, as before) and then after start() (one client
+with a connection pool). Without --endpoint it starts a moto S3 server in a
+subprocess. A loopback stand-in hides TLS and network round trips, so
+against real storage the gap is larger. Prints ops/sec and p50/p99 per pair.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from services.s3_service import S3Client
+from benchmarks.common import percentile, moto_server
+
+
+async def _run_ops(client: S3Client, ops: int, concurrency: int) -> tuple[float, list[float]]:
+    latencies = []
+    counter = iter(range(ops))
+
+    async def worker():
+        for seq in counter:
+            started = time.perf_counter()
+            s3_key = f"s3-bench-{uuid.uuid4().hex}-{seq}.txt"
+            await client.put_file(s3_key=s3_key, file=b"s3-bench")
+            await client.head_file(s3_key)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return ops / (time.perf_counter() - started), latencies
+
+
+async def main(endpoint: str, bucket: str, access_key: str, secret_key: str, ops: int, concurrency: int, create_bucket: bool):
+    client = S3Client(
+        access_key=access_key,
+        secret_key=secret_key,
+        endpoint_url=endpoint,
+        bucket_name=bucket,
+        static_domain="s3-bench.invalid",
+        max_pool_connections=concurrency,
+    )
+    if create_bucket:
+        async with client.get_client() as raw_client:
+            await raw_client.create_bucket(Bucket=bucket)
+
+    results = {}
+    results["client per op"] = await _run_ops(client, ops, concurrency)
+    await client.start()
+    try:
+        results["pooled client"] = await _run_ops(client, ops, concurrency)
+    finally:
+        await client.close()
+
+    for name, (rate, latencies) in results.items():
+        print(
+            f"{name:<13}: {rate:7.1f} ops/sec, put+head "
+            f"p50={percentile(latencies, 0.5) * 1000:.1f} ms p99={percentile(latencies, 0.99) * 1000:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pooled vs per-operation S3 clients")
+    parser.add_argument("--endpoint", help="S3 endpoint; a local moto server by default")
+    parser.add_argument("--bucket", default="s3-bench")
+    parser.add_argument("--access-key", default="test")
+    parser.add_argument("--secret-key", default="test")
+    parser.add_argument("--ops", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.endpoint:
+        asyncio.run(main(args.endpoint, args.bucket, args.access_key, args.secret_key, args.ops, args.concurrency, False))
+    else:
+        with moto_server() as endpoint:
+            asyncio.run(main(endpoint, args.bucket, args.access_key, args.secret_key, args.ops, args.concurrency, True))
@@ -0,0 +1,65 @@
+"""Compares the per-task overhead of asyncio.run with a fresh engine and of the persistent WorkerRuntime.
+
+    python -m benchmarks.worker_runtime_bench --tasks 200
+
+Runs against the configured database, in this process, without Celery. Each
+"task" is one SELECT 1. The old way wraps it in asyncio.run() with an
+engine created and disposed per task, since pooled connections can't
+outlive their loop. The new way runs it through runtime.run() on the
+worker's loop and engine. The S3 client side of the runtime is measured by
+benchmarks.s3_client_bench. Prints tasks/sec and p50/p99 per task.
+"""
+import argparse
+import asyncio
+import time
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from services.worker_runtime import runtime
+from settings import settings
+from benchmarks.common import percentile
+
+
+async def _select(session_factory):
+    async with session_factory() as session:
+        await session.execute(text("SELECT 1"))
+
+
+async def _fresh_engine_task():
+    engine = create_async_engine(settings.DATABASE_ASYNC_URL)
+    try:
+        await _select(async_sessionmaker(bind=engine, expire_on_commit=False))
+    finally:
+        await engine.dispose()
+
+
+def _run_tasks(run_task, tasks: int) -> tuple[float, list[float]]:
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(tasks):
+        task_started = time.perf_counter()
+        run_task()
+        latencies.append(time.perf_counter() - task_started)
+    return tasks / (time.perf_counter() - started), latencies
+
+
+def main(tasks: int):
+    results = {"asyncio.run": _run_tasks(lambda: asyncio.run(_fresh_engine_task()), tasks)}
+    runtime.start()
+    try:
+        results["worker runtime"] = _run_tasks(lambda: runtime.run(_select(runtime.session_factory)), tasks)
+    finally:
+        runtime.stop()
+
+    for name, (rate, latencies) in results.items():
+        print(
+            f"{name:<14}: {rate:7.1f} tasks/sec, "
+            f"p50={percentile(latencies, 0.5) * 1000:.2f} ms p99={percentile(latencies, 0.99) * 1000:.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark per-task event loop and engine overhead")
+    parser.add_argument("--tasks", type=int, default=200)
+    args = parser.parse_args()
+
+    main(args.tasks)
@@ -1,8 +1,9 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from db.models.models import UsersOrm, PortalRole, EventsOrm
-from sqlalchemy.dialects.postgresql import UUID
+from db.models.models import UsersOrm, PortalRole, EventsOrm, PhotosOrm
+from sqlalchemy.dialects.postgresql import UUID, insert
 from typing import Optional
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update, delete, tuple_, exists, bindparam
+from datetime import datetime
 
 
 
@@ -89,12 +90,22 @@ class EventsDAL:
     def __init__(self, db_session: AsyncSession):
         self.db_session = db_session
 
-    async def create_event(self, title: str, text: str, author_id: UUID, photo: Optional[str] = None) -> EventsOrm:
+    async def create_event(
+            self,
+            title: str,
+            text: str,
+            author_id: UUID,
+            photo: Optional[str] = None,
+            photo_variants: Optional[dict] = None,
+            photo_hash: Optional[str] = None,
+    ) -> EventsOrm:
         new_event = EventsOrm(
             title=title,
             text=text,
             author_id=author_id,
-            photo=photo
+            photo=photo,
+            photo_variants=photo_variants,
+            photo_hash=photo_hash,
         )
 
         self.db_session.add(new_event)
@@ -122,6 +133,29 @@ class EventsDAL:
         res = await self.db_session.execute(query)
         events_orm = res.scalars().all()
         return events_orm
+
+    async def get_events_after_cursor(
+            self,
+            limit: int,
+            created_at: Optional[datetime] = None,
+            event_id: Optional[UUID] = None,
+            only_with_photo: bool = False,
+    ) -> list[EventsOrm]:
+        """ Keyset pagination: events strictly older than (created_at, event_id) """
+        query = (
+            select(EventsOrm)
+            .order_by(EventsOrm.created_at.desc(), EventsOrm.event_id.desc())
+            .limit(limit)
+        )
+        if only_with_photo:
+            query = query.where(EventsOrm.photo.is_not(None))
+        if created_at is not None and event_id is not None:
+            query = query.where(
+                tuple_(EventsOrm.created_at, EventsOrm.event_id) < tuple_(created_at, event_id)
+            )
+        res = await self.db_session.execute(query)
+        events_orm = res.scalars().all()
+        return events_orm
     
     async def get_event_by_id(self, event_id) -> EventsOrm:
         query = (
@@ -132,11 +166,26 @@ class EventsDAL:
         events_orm = res.scalars().one_or_none()
         return events_orm
     
-    async def update_photo(self, event_id, photo) -> Optional[UUID]:
+    async def get_photo_hashes(self, event_ids: list[UUID]) -> dict[UUID, Optional[str]]:
+        """ event_id -> photo_hash for the events that exist """
+        query = (
+            select(EventsOrm.event_id, EventsOrm.photo_hash)
+            .where(EventsOrm.event_id.in_(event_ids))
+        )
+        res = await self.db_session.execute(query)
+        return {event_id: photo_hash for event_id, photo_hash in res.all()}
+
+    async def update_photo(
+            self,
+            event_id,
+            photo,
+            photo_variants: Optional[dict] = None,
+            photo_hash: Optional[str] = None,
+    ) -> Optional[UUID]:
         query = (
             update(EventsOrm)
             .where(EventsOrm.event_id==event_id)
-            .values(photo=photo)
+            .values(photo=photo, photo_variants=photo_variants, photo_hash=photo_hash)
             .returning(EventsOrm.event_id)
         )
 
@@ -144,6 +193,125 @@ class EventsDAL:
         response = res.scalars().one_or_none()
         return response
 
+    async def update_photos(self, photos: list[dict]) -> list[UUID]:
+        """ Bulk UPDATE of optimized photos, dicts hold event_id, source, photo
+        and photo_variants. A row is only updated while its photo is still
+        `source`, so a photo replaced meanwhile is left alone. Returns the ids
+        of the updated events """
+        events = EventsOrm.__table__
+        query = (
+            update(events)
+            .where(events.c.event_id==bindparam("b_event_id"), events.c.photo==bindparam("b_source"))
+            .values(photo=bindparam("b_photo"), photo_variants=bindparam("b_photo_variants"))
+        )
+        await self.db_session.execute(query, [
+            {
+                "b_event_id": photo["event_id"],
+                "b_source": photo["source"],
+                "b_photo": photo["photo"],
+                "b_photo_variants": photo["photo_variants"],
+            }
+            for photo in photos
+        ])
+        # executemany reports no per-row result; new photo urls are unique per render
+        res = await self.db_session.execute(
+            select(EventsOrm.event_id)
+            .where(tuple_(EventsOrm.event_id, EventsOrm.photo).in_([(photo["event_id"], photo["photo"]) for photo in photos]))
+        )
+        return list(res.scalars().all())
+
+    async def update_photos_by_hash(self, photos: list[dict]):
+        """ Points every event sharing a content hash at the new photo, dicts
+        hold content_hash, source, photo and photo_variants; like
+        update_photos only rows still showing `source` are changed """
+        events = EventsOrm.__table__
+        query = (
+            update(events)
+            .where(events.c.photo_hash==bindparam("b_content_hash"), events.c.photo==bindparam("b_source"))
+            .values(photo=bindparam("b_photo"), photo_variants=bindparam("b_photo_variants"))
+        )
+        await self.db_session.execute(query, [
+            {
+                "b_content_hash": photo["content_hash"],
+                "b_source": photo["source"],
+                "b_photo": photo["photo"],
+                "b_photo_variants": photo["photo_variants"],
+            }
+            for photo in photos
+        ])
+
+
+#########
+# Photos
+#########
+
+class PhotosDAL:
+    ''' DAL for content-addressed photos shared between events '''
+
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    async def get_photo(self, content_hash: str) -> Optional[PhotosOrm]:
+        query = (
+            select(PhotosOrm)
+            .where(PhotosOrm.content_hash==content_hash)
+        )
+        res = await self.db_session.execute(query)
+        return res.scalars().one_or_none()
+
+    async def acquire_photo(self, content_hash: str, photo: str) -> tuple[PhotosOrm, bool]:
+        """ Returns the stored photo for the hash, inserting it first if
+        there is none yet; the flag tells whether this call inserted it """
+        query = (
+            insert(PhotosOrm)
+            .values(content_hash=content_hash, photo=photo)
+            .on_conflict_do_nothing(index_elements=[PhotosOrm.content_hash])
+            .returning(PhotosOrm.content_hash)
+        )
+        res = await self.db_session.execute(query)
+        created = res.scalars().one_or_none() is not None
+        return await self.get_photo(content_hash), created
+
+    async def update_photos(self, photos: list[dict]) -> list[str]:
+        """ Bulk UPDATE guarded like EventsDAL.update_photos, dicts hold
+        content_hash, source, photo and photo_variants. Returns the hashes of
+        the updated photos """
+        photos_table = PhotosOrm.__table__
+        query = (
+            update(photos_table)
+            .where(photos_table.c.content_hash==bindparam("b_content_hash"), photos_table.c.photo==bindparam("b_source"))
+            .values(photo=bindparam("b_photo"), photo_variants=bindparam("b_photo_variants"))
+        )
+        await self.db_session.execute(query, [
+            {
+                "b_content_hash": photo["content_hash"],
+                "b_source": photo["source"],
+                "b_photo": photo["photo"],
+                "b_photo_variants": photo["photo_variants"],
+            }
+            for photo in photos
+        ])
+        res = await self.db_session.execute(
+            select(PhotosOrm.content_hash)
+            .where(tuple_(PhotosOrm.content_hash, PhotosOrm.photo).in_([(photo["content_hash"], photo["photo"]) for photo in photos]))
+        )
+        return list(res.scalars().all())
+
+    async def delete_unreferenced(self, content_hash: str) -> Optional[PhotosOrm]:
+        """ Deletes the photo if no event references it any more and returns
+        it so its objects can be removed. An event inserted concurrently makes
+        this fail with IntegrityError through the foreign key """
+        query = (
+            delete(PhotosOrm)
+            .where(
+                PhotosOrm.content_hash==content_hash,
+                ~exists().where(EventsOrm.photo_hash==content_hash),
+            )
+            .returning(PhotosOrm)
+        )
+        res = await self.db_session.execute(query)
+        return res.scalars().one_or_none()
+
 
 
 
@@ -2,8 +2,8 @@ from db.database import Base
 from typing import Annotated
 import uuid
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy.dialects.postgresql import UUID 
-from sqlalchemy import String, ARRAY, func, ForeignKey
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy import String, ARRAY, func, ForeignKey, Index
 from enum import  StrEnum
 from datetime import datetime, timezone
 from sqlalchemy import DateTime 
@@ -68,9 +68,29 @@ class EventsOrm(Base):
     text: Mapped[str]
     author_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.user_id", ondelete="CASCADE"))
     photo: Mapped[str | None]
+    # set for content-addressed uploads; events with the same hash share the objects
+    photo_hash: Mapped[str | None] = mapped_column(String(64), ForeignKey("photos.content_hash"), index=True)
+    # {"thumbnail": {"width": .., "height": .., "urls": {"webp": .., "jpeg": ..}}, ...}
+    photo_variants: Mapped[dict | None] = mapped_column(JSONB)
     likes: Mapped[int] = mapped_column(default=0)
     created_at: Mapped[created_at]
     updated_at: Mapped[updated_at]
 
     author:  Mapped["UsersOrm"] = relationship("UsersOrm", back_populates="events")
 
+
+class PhotosOrm(Base):
+    """ Uploaded photo stored under its content hash, shared by every event
+    that uploaded the same bytes """
+    __tablename__ = "photos"
+
+    content_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    photo: Mapped[str]
+    # same layout as EventsOrm.photo_variants; None until the worker optimized it
+    photo_variants: Mapped[dict | None] = mapped_column(JSONB)
+    created_at: Mapped[created_at]
+
+
+# backs keyset pagination of the feed: ORDER BY created_at DESC, event_id DESC
+Index("ix_events_created_at_event_id", EventsOrm.created_at.desc(), EventsOrm.event_id.desc())
+
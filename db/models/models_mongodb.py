@@ -12,6 +12,7 @@ class Message(Document):
     class Settings:
         name = "messages"
         indexes = [
-            [("created_at", 1)],
+            # history pages sort and seek on (created_at, _id); also serves created_at-only queries
+            [("created_at", -1), ("_id", -1)],
             [("sender_id", 1)],
         ]
\ No newline at end of file
@@ -1,13 +1,87 @@
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from settings import settings
+
+# memory_cost is in KiB
+HASHING_PROFILES = {
+    "low": {"time_cost": 2, "memory_cost": 19456, "parallelism": 1},
+    "default": {"time_cost": 3, "memory_cost": 102400, "parallelism": 2},
+    "high": {"time_cost": 4, "memory_cost": 262144, "parallelism": 4},
+}
+
+
+def _hasher_params() -> dict:
+    params = dict(HASHING_PROFILES[settings.HASHING_PROFILE])
+    # explicit values (e.g. from the calibrate command) override the profile
+    if settings.HASHING_TIME_COST is not None:
+        params["time_cost"] = settings.HASHING_TIME_COST
+    if settings.HASHING_MEMORY_COST is not None:
+        params["memory_cost"] = settings.HASHING_MEMORY_COST
+    if settings.HASHING_PARALLELISM is not None:
+        params["parallelism"] = settings.HASHING_PARALLELISM
+    return params
+
 
 ph = PasswordHasher(
-    time_cost=3,     
-    memory_cost=102400,  
-    parallelism=2,    
+    **_hasher_params(),
     hash_len=32,      
     salt_len=16
 )
 
+
+class HashingPoolBusy(Exception):
+    """ Raised when too many hashing jobs are already waiting for a worker """
+
+
+class HashingPool:
+    """ Runs Argon2 in a bounded thread pool so hashing never blocks the event loop """
+
+    def __init__(self, max_workers: int, max_waiting: int):
+        # argon2-cffi releases the GIL while hashing, so threads run in parallel
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="argon2")
+        self.semaphore = asyncio.Semaphore(max_workers)
+        self.max_waiting = max_waiting
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    async def run(self, func, *args):
+        if self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise HashingPoolBusy()
+
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.active -= 1
+            self.semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
+
+
+hashing_pool = HashingPool(
+    max_workers=settings.HASHING_MAX_WORKERS,
+    max_waiting=settings.HASHING_MAX_WAITING,
+)
+
+
 class Hasher:
 
 
@@ -19,3 +93,65 @@ class Hasher:
     def get_password_hash(password: str) -> str:
         return ph.hash(password)
 
+    @staticmethod
+    def needs_rehash(hashed_password: str) -> bool:
+        """ True if the hash was made with parameters other than the current ones """
+        return ph.check_needs_rehash(hashed_password)
+
+    @staticmethod
+    async def verify_password_async(hashed_password: str, plain_password: str) -> bool:
+        try:
+            return await hashing_pool.run(ph.verify, hashed_password, plain_password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+    @staticmethod
+    async def get_password_hash_async(password: str) -> str:
+        return await hashing_pool.run(ph.hash, password)
+
+
+def _measure_hash_ms(time_cost: int, memory_cost: int, parallelism: int, rounds: int = 3) -> float:
+    hasher = PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        hasher.hash("calibration-password")
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def calibrate(target_ms: float, time_cost: int, parallelism: int, max_memory_cost: int) -> dict | None:
+    """ Doubles memory_cost while a hash still fits into target_ms on this machine """
+    best = None
+    memory_cost = 8192
+    while memory_cost <= max_memory_cost:
+        elapsed = _measure_hash_ms(time_cost, memory_cost, parallelism)
+        print(f"time_cost={time_cost} memory_cost={memory_cost} parallelism={parallelism}: {elapsed:.1f} ms")
+        if elapsed > target_ms:
+            break
+        best = {
+            "time_cost": time_cost,
+            "memory_cost": memory_cost,
+            "parallelism": parallelism,
+            "ms": elapsed,
+        }
+        memory_cost *= 2
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Suggest Argon2 parameters for a hash latency budget")
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument("--time-cost", type=int, default=3)
+    parser.add_argument("--parallelism", type=int, default=2)
+    parser.add_argument("--max-memory-cost", type=int, default=1048576)
+    args = parser.parse_args()
+
+    suggestion = calibrate(args.target_ms, args.time_cost, args.parallelism, args.max_memory_cost)
+    if suggestion is None:
+        print("Even the smallest memory_cost exceeds the budget, lower --time-cost or raise --target-ms")
+    else:
+        print(f"Suggested ({suggestion['ms']:.1f} ms per hash):")
+        print(f"HASHING_TIME_COST={suggestion['time_cost']}")
+        print(f"HASHING_MEMORY_COST={suggestion['memory_cost']}")
+        print(f"HASHING_PARALLELISM={suggestion['parallelism']}")
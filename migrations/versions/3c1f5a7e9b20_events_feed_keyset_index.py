@@ -0,0 +1,33 @@
+"""events feed keyset index
+
+Revision ID: 3c1f5a7e9b20
+Revises: fffa41dfdafe
+Create Date: 2026-01-12 19:42:10.118245
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1f5a7e9b20'
+down_revision: Union[str, Sequence[str], None] = 'fffa41dfdafe'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_events_created_at_event_id',
+        'events',
+        [sa.text('created_at DESC'), sa.text('event_id DESC')],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_events_created_at_event_id', table_name='events')
@@ -0,0 +1,140 @@
+"""Re-optimizes existing event photos with the current resize settings.
+
+    python -m services.backfill_images --batch-size 20 --max-in-flight 4
+
+Events are read newest first in keyset order and sent to the image queue as
+optimize_images_batch_task batches, with at most --max-in-flight batches
+outstanding. After every finished batch the position is written to the
+checkpoint file, so an interrupted run resumes where it stopped. Events whose
+photo_variants already match IMAGE_VARIANTS / IMAGE_VARIANT_FORMATS are
+skipped unless --force is given.
+
+The originals are gone once a photo has been optimized, so already optimized
+photos are re-rendered from their largest variant. A photo shared by several
+events (same content hash) is sent once; the worker updates all of them.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Optional
+from celery.result import AsyncResult
+from db.database import async_session_factory
+from db.dals import EventsDAL
+from db.models.models import EventsOrm
+from api.actions.events import encode_cursor, decode_cursor, _event_photo_keys
+from services.resize_images import optimize_images_batch_task
+from services.s3_service import s3_client
+from settings import settings
+
+
+def _needs_backfill(event: EventsOrm) -> bool:
+    variants = event.photo_variants or {}
+    for name in settings.IMAGE_VARIANTS:
+        if name not in variants:
+            return True
+        if not set(settings.IMAGE_VARIANT_FORMATS) <= set(variants[name]["urls"]):
+            return True
+    return False
+
+
+def _load_checkpoint(path: str) -> tuple[Optional[str], int]:
+    if not os.path.exists(path):
+        return None, 0
+    with open(path) as f:
+        checkpoint = json.load(f)
+    return checkpoint["cursor"], checkpoint["processed"]
+
+
+def _save_checkpoint(path: str, cursor: str, processed: int):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"cursor": cursor, "processed": processed}, f)
+    os.replace(tmp_path, path)
+
+
+async def _finish_batch(batch: list[EventsOrm], result: Optional[AsyncResult]) -> int:
+    """ Waits for the batch and deletes the replaced variants; returns how many events were updated """
+    if result is None:
+        return 0
+    updated_ids = {str(event_id) for event_id in await asyncio.to_thread(result.get)}
+    for event in batch:
+        if str(event.event_id) in updated_ids:
+            # the worker already removed the source photo, delete_file is idempotent
+            await asyncio.gather(
+                *(s3_client.delete_file(s3_key=s3_key) for s3_key in _event_photo_keys(event)),
+                return_exceptions=True,
+            )
+    return len(updated_ids)
+
+
+async def backfill(batch_size: int, max_in_flight: int, checkpoint_path: str, force: bool):
+    cursor, processed = _load_checkpoint(checkpoint_path)
+    skipped = 0
+    # shared photos already sent in this run
+    seen_hashes = set()
+    # (cursor after the batch, batch, task result), finished in FIFO order
+    in_flight = deque()
+    started = time.monotonic()
+    processed_at_start = processed
+
+    async def finish_oldest():
+        nonlocal processed
+        batch_cursor, batch, result = in_flight.popleft()
+        processed += await _finish_batch(batch, result)
+        _save_checkpoint(checkpoint_path, batch_cursor, processed)
+        elapsed = time.monotonic() - started
+        rate = (processed - processed_at_start) / elapsed if elapsed else 0.0
+        print(f"processed={processed} skipped={skipped} {rate:.2f} images/sec")
+
+    await s3_client.start()
+    try:
+        while True:
+            created_at, event_id = decode_cursor(cursor) if cursor else (None, None)
+            async with async_session_factory() as session:
+                events_dal = EventsDAL(session)
+                events = await events_dal.get_events_after_cursor(
+                    limit=batch_size,
+                    created_at=created_at,
+                    event_id=event_id,
+                    only_with_photo=True,
+                )
+            if not events:
+                break
+
+            cursor = encode_cursor(events[-1].created_at, events[-1].event_id)
+            batch = []
+            for event in events:
+                if not (force or _needs_backfill(event)) or event.photo_hash in seen_hashes:
+                    continue
+                if event.photo_hash is not None:
+                    seen_hashes.add(event.photo_hash)
+                batch.append(event)
+            skipped += len(events) - len(batch)
+            result = None
+            if batch:
+                result = optimize_images_batch_task.delay([(str(event.event_id), event.photo) for event in batch])
+            in_flight.append((cursor, batch, result))
+
+            while len(in_flight) >= max_in_flight:
+                await finish_oldest()
+
+        while in_flight:
+            await finish_oldest()
+    finally:
+        await s3_client.close()
+
+    print(f"Done: processed={processed} skipped={skipped}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-optimize existing event photos")
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    parser.add_argument("--checkpoint", default=".backfill_images.json")
+    parser.add_argument("--force", action="store_true", help="also re-process photos that match the current settings")
+    args = parser.parse_args()
+
+    asyncio.run(backfill(args.batch_size, args.max_in_flight, args.checkpoint, args.force))
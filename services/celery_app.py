@@ -6,6 +6,19 @@ celery = Celery(
     "services.celery_app",
     broker=settings.CELERY_BROKER_URL,
     backend=settings.CELERY_RESULT_BACKEND,
-    include=["services.resize_images"],
+    include=["services.resize_images", "services.storage_tasks"],
     brocker_connection_retry_on_startup=True,
-)
\ No newline at end of file
+)
+
+# CPU-heavy image work gets its own queue and workers (see docker-compose),
+# so it never delays the light tasks on the default queue
+celery.conf.update(
+    task_routes={
+        "optimize_image_task": {"queue": settings.IMAGE_QUEUE},
+        "optimize_images_batch_task": {"queue": settings.IMAGE_QUEUE},
+    },
+    # long CPU-bound tasks: take one at a time and ack after completion,
+    # so a busy process doesn't hold a backlog other processes could run
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+)
@@ -0,0 +1,81 @@
+""" Versioned feed cache shared by the API and the workers: the Redis
+generation keys, the in-process tiers and their cross-process invalidation """
+import asyncio
+from settings import settings
+from services.local_cache import LocalCache
+from services.redis_service import redis_client, redis_breaker
+
+
+# Feed cache keys embed a generation number, so invalidation is a single INCR
+# instead of a KEYS scan; entries of older generations simply expire.
+# "head" covers everything a new event can shift (OFFSET pages and the first
+# cursor page), "tail" covers cursor pages past the head, which only a delete
+# can change.
+FEED_HEAD_VERSION_KEY = "events:version:head"
+FEED_TAIL_VERSION_KEY = "events:version:tail"
+FEED_CACHE_TTL = 600
+
+async def get_feed_version(key: str) -> int:
+    return int(await redis_client.get(key) or 0)
+
+# In-process tier in front of Redis. Kept in sync across workers through
+# FEED_INVALIDATION_CHANNEL; the short TTL bounds staleness if a message is lost.
+FEED_INVALIDATION_CHANNEL = "events:invalidate"
+
+feed_head_cache = LocalCache(
+    max_items=settings.LOCAL_CACHE_MAX_ITEMS,
+    max_bytes=settings.LOCAL_CACHE_MAX_BYTES,
+    ttl=settings.LOCAL_CACHE_TTL,
+)
+feed_tail_cache = LocalCache(
+    max_items=settings.LOCAL_CACHE_MAX_ITEMS,
+    max_bytes=settings.LOCAL_CACHE_MAX_BYTES,
+    ttl=settings.LOCAL_CACHE_TTL,
+)
+event_local_cache = LocalCache(
+    max_items=settings.LOCAL_CACHE_MAX_ITEMS,
+    max_bytes=settings.LOCAL_CACHE_MAX_BYTES,
+    ttl=settings.LOCAL_CACHE_TTL,
+)
+
+def _apply_invalidation(scope: str):
+    feed_head_cache.clear()
+    if scope == "all":
+        feed_tail_cache.clear()
+        event_local_cache.clear()
+
+async def invalidate_feed_cache(all_pages: bool = False):
+    scope = "all" if all_pages else "head"
+    _apply_invalidation(scope)
+    try:
+        if redis_breaker.allow_request():
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.incr(FEED_HEAD_VERSION_KEY)
+                if all_pages:
+                    pipe.incr(FEED_TAIL_VERSION_KEY)
+                pipe.publish(FEED_INVALIDATION_CHANNEL, scope)
+                await pipe.execute()
+            redis_breaker.record_success()
+    except Exception as e:
+        print(f"Redis error (invalidate): {e}")
+        redis_breaker.record_failure()
+
+async def listen_cache_invalidations():
+    """ Background task: applies invalidations published by other workers """
+    while True:
+        try:
+            async with redis_client.pubsub() as pubsub:
+                await pubsub.subscribe(FEED_INVALIDATION_CHANNEL)
+                # anything published while we were not subscribed is lost
+                _apply_invalidation("all")
+                while True:
+                    # poll with a timeout: a blocking read would trip the pool's socket_timeout
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None:
+                        _apply_invalidation(message["data"].decode())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Redis error (pubsub): {e}")
+            redis_breaker.record_failure()
+            await asyncio.sleep(1)
@@ -0,0 +1,66 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class LocalCache:
+    """ Bounded in-process LRU cache of bytes values with a per-entry TTL """
+
+    def __init__(self, max_items: int, max_bytes: int, ttl: float):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._size = 0
+        # bumped by clear(); lets a put() that raced with an invalidation be dropped
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._pop(key)
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: bytes, generation: Optional[int] = None):
+        if generation is not None and generation != self.generation:
+            return
+        if len(value) > self.max_bytes:
+            return
+
+        self._pop(key)
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._size += len(value)
+
+        while len(self._data) > self.max_items or self._size > self.max_bytes:
+            _, (_, old_value) = self._data.popitem(last=False)
+            self._size -= len(old_value)
+
+    def _pop(self, key: str):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+    def clear(self):
+        self._data.clear()
+        self._size = 0
+        self.generation += 1
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "items": len(self._data),
+            "bytes": self._size,
+        }
@@ -0,0 +1,88 @@
+import datetime
+from bisect import bisect_left, bisect_right
+from typing import Optional
+from bson import ObjectId
+
+# messages are ordered by (created_at, _id), like the history index
+MessageKey = tuple[datetime.datetime, ObjectId]
+
+
+class RecentMessages:
+    """ The latest max_items chat messages in (created_at, _id) order, each
+    kept as its serialized JSON so a page is joined, not re-encoded """
+
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self._keys: list[MessageKey] = []
+        self._values: list[bytes] = []
+        self._ids: set[ObjectId] = set()
+        # until warm() ran we can't tell which older messages exist
+        self.warmed = False
+        # nothing older than the oldest kept message exists
+        self.has_all = False
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, key: MessageKey, value: bytes):
+        if key[1] in self._ids:
+            return
+        # messages relayed from other processes may arrive slightly out of order
+        index = bisect_right(self._keys, key)
+        self._keys.insert(index, key)
+        self._values.insert(index, value)
+        self._ids.add(key[1])
+
+        while len(self._keys) > self.max_items:
+            _, oldest_id = self._keys.pop(0)
+            self._values.pop(0)
+            self._ids.discard(oldest_id)
+            self.has_all = False
+
+    def warm(self, entries: list[tuple[MessageKey, bytes]], has_all: bool):
+        """ Merges the latest messages from storage; has_all tells that
+        storage returned fewer than it was asked for """
+        self.has_all = has_all
+        for key, value in entries:
+            self.add(key, value)
+        self.warmed = True
+
+    def page(
+            self,
+            limit: int,
+            before: Optional[MessageKey] = None,
+            after: Optional[MessageKey] = None,
+    ) -> Optional[list[tuple[MessageKey, bytes]]]:
+        """ Same page as a storage query would return, or None if part of it
+        may lie before the kept window """
+        entries = self._page(limit, before, after)
+        if entries is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entries
+
+    def _page(self, limit, before, after):
+        if not self.warmed:
+            return None
+
+        if after is not None:
+            if not self.has_all and (not self._keys or after < self._keys[0]):
+                return None
+            start = bisect_right(self._keys, after)
+            end = start + limit
+        else:
+            end = bisect_left(self._keys, before) if before is not None else len(self._keys)
+            start = end - limit
+            if start < 0:
+                if not self.has_all:
+                    return None
+                start = 0
+
+        return list(zip(self._keys[start:end], self._values[start:end]))
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "items": len(self._keys),
+        }
@@ -0,0 +1,94 @@
+import asyncio
+import time
+from enum import StrEnum
+import redis.asyncio as redis_async
+from settings import settings
+
+
+class BreakerState(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class RedisCircuitBreaker:
+    """ Tracks Redis health so callers check a local flag instead of pinging """
+
+    def __init__(
+            self,
+            client: redis_async.Redis,
+            failure_threshold: int,
+            reset_timeout: float,
+            probe_interval: float,
+    ):
+        self.client = client
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_interval = probe_interval
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        # when the current HALF_OPEN trial was admitted
+        self.trial_started_at = 0.0
+
+    def allow_request(self) -> bool:
+        now = time.monotonic()
+        if self.state == BreakerState.CLOSED:
+            return True
+        if self.state == BreakerState.OPEN:
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            self.state = BreakerState.HALF_OPEN
+        elif now - self.trial_started_at < self.reset_timeout:
+            # one trial at a time, the rest are rejected until its result is recorded
+            return False
+        # a trial whose result is never recorded only blocks others for reset_timeout
+        self.trial_started_at = now
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.state = BreakerState.CLOSED
+        self.trial_started_at = 0.0
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_started_at = 0.0
+        if self.state == BreakerState.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = BreakerState.OPEN
+            self.opened_at = time.monotonic()
+
+    async def run_health_probe(self):
+        """ Background task: pings Redis periodically and updates the state """
+        while True:
+            try:
+                await self.client.ping()
+                self.record_success()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Redis error (probe): {e}")
+                self.record_failure()
+            await asyncio.sleep(self.probe_interval)
+
+
+# blocking pool: when all connections are busy callers wait up to
+# REDIS_POOL_TIMEOUT instead of opening unbounded new connections
+redis_pool = redis_async.BlockingConnectionPool(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    password=settings.REDIS_PASS,
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+    timeout=settings.REDIS_POOL_TIMEOUT,
+    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+)
+
+redis_client = redis_async.Redis(connection_pool=redis_pool)
+
+redis_breaker = RedisCircuitBreaker(
+    client=redis_client,
+    failure_threshold=settings.REDIS_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=settings.REDIS_BREAKER_RESET_TIMEOUT,
+    probe_interval=settings.REDIS_HEALTH_PROBE_INTERVAL,
+)
@@ -1,12 +1,15 @@
 import io
+import math
 import asyncio
-from PIL import Image, ImageOps
+import tempfile
+from concurrent.futures import Executor, ThreadPoolExecutor
+from PIL import Image, ImageOps, ExifTags
 from pillow_heif import register_heif_opener
 from services.celery_app import celery
 from services.s3_service import s3_client 
-from db.database import async_session_factory 
-from db.dals import EventsDAL
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from services.feed_cache import invalidate_feed_cache
+from services.worker_runtime import runtime
+from db.dals import EventsDAL, PhotosDAL
 from settings import settings
 import uuid
 from typing import Optional
@@ -21,60 +24,306 @@ async def optimize_image_logic(event_id: uuid.UUID, s3_key: str) -> Optional[UUI
     # Now we log details for debugging
     logger.info(f'EVENT_ID: {event_id} | S3_KEY: {s3_key}')
     
-    filename_old = s3_key.split("/")[-1]
-    logger.info(f'EXTRACTED FILENAME: {filename_old}')
-    
-    file_bytes = await s3_client.get_file(filename_old)
-    
-    # 2. Обработка Pillow (оставляем твою отличную логику)
-    img = Image.open(io.BytesIO(file_bytes))
+    updated_event_id = await _optimize_image(event_id, s3_key)
+
+    # cached feed pages still point at the original, which is deleted now
+    await invalidate_feed_cache(all_pages=True)
+    return updated_event_id
+
+
+# keep the decoded image at least this many times larger than the final
+# size, so the LANCZOS resample still has real pixels to work with
+REDUCING_GAP = 2.0
+
+
+def _fit_size(img: Image.Image, box: tuple[int, int]) -> tuple[int, int]:
+    """ Size the image will have inside `box` once EXIF rotation is applied """
+    width, height = img.size
+    if img.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8):
+        box = (box[1], box[0])
+    scale = min(box[0] / width, box[1] / height, 1.0)
+    return math.ceil(width * scale), math.ceil(height * scale)
+
+
+# modes Image.reduce() has kernels for
+REDUCIBLE_MODES = ("L", "LA", "RGB", "RGBA", "CMYK", "I", "F")
+
+
+def _output_mode(mode: str) -> str:
+    return "RGBA" if mode in ("RGBA", "LA", "P") else "RGB"
+
+
+def _reducible_mode(mode: str) -> str:
+    """ Closest mode reduce() accepts for palette, 1-bit and 16-bit images """
+    if mode == "1":
+        return "L"
+    if mode.startswith("I;16"):
+        return "I"
+    return _output_mode(mode)
+
+
+def decode_for_box(fileobj, box: tuple[int, int]) -> Image.Image:
+    """ Decodes only as many pixels as rendering into `box` needs: JPEG DCT
+    scaling via draft() before loading, then an integer reduce() for formats
+    that can't decode at a lower scale (PNG, HEIC, ...) """
+    img = Image.open(fileobj)
+    fit_width, fit_height = _fit_size(img, box)
+    img.draft(None, (int(fit_width * REDUCING_GAP), int(fit_height * REDUCING_GAP)))
+
+    factor = int(min(img.width / fit_width, img.height / fit_height) / REDUCING_GAP)
+    if factor > 1:
+        if img.mode not in REDUCIBLE_MODES:
+            img = img.convert(_reducible_mode(img.mode))
+        img = img.reduce(factor)
+
     img = ImageOps.exif_transpose(img)
-    
-    if img.mode in ("RGBA", "LA", "P"):
-        img = img.convert("RGBA")
-    else:
-        img = img.convert("RGB")
+    return img.convert(_output_mode(img.mode))
+
+
+# variant format -> (Pillow format, file extension, encoder options)
+FORMAT_OPTIONS = {
+    "webp": ("WEBP", "webp", {"quality": 80}),
+    "jpeg": ("JPEG", "jpg", {"quality": 82, "optimize": True, "progressive": True}),
+    "avif": ("AVIF", "avif", {"quality": 60}),
+}
+
+# above this many pixels the encoders run at a lower effort setting; the
+# slowest modes only pay off on small images
+HIGH_EFFORT_MAX_PIXELS = 1_000_000
+
 
-    img.thumbnail((1920, 1080), Image.Resampling.LANCZOS)
+def _encoder_effort(image_format: str, img: Image.Image) -> dict:
+    high_effort = img.width * img.height <= HIGH_EFFORT_MAX_PIXELS
+    if image_format == "webp":
+        return {"method": 6 if high_effort else 4}
+    if image_format == "avif":
+        return {"speed": 4 if high_effort else 7}
+    return {}
+
+
+def _encode(img: Image.Image, image_format: str) -> io.BytesIO:
+    pil_format, _, options = FORMAT_OPTIONS[image_format]
+    if pil_format == "JPEG" and img.mode != "RGB":
+        img = img.convert("RGB")
 
     output = io.BytesIO()
-    img.save(output, format="WEBP", quality=80, method=6)
+    img.save(output, format=pil_format, **options, **_encoder_effort(image_format, img))
     output.seek(0)
+    return output
+
+
+def render_variants(img: Image.Image, variants: dict[str, tuple[int, int]], formats: list[str]) -> dict[str, dict]:
+    """ Renders every variant from one decoded image: largest first, each
+    downscaled from the previous one instead of from the original """
+    rendered = {}
+    for name, size in sorted(variants.items(), key=lambda item: item[1][0] * item[1][1], reverse=True):
+        img.thumbnail(size, Image.Resampling.LANCZOS)
+        rendered[name] = {
+            "width": img.width,
+            "height": img.height,
+            "files": {image_format: _encode(img, image_format) for image_format in formats},
+        }
+    return rendered
+
+
+def _variant_key(event_id, render_id: str, name: str, image_format: str) -> str:
+    # never derived from the source key, so re-optimizing doesn't grow the names;
+    # render_id keeps a re-render from overwriting the variants it replaces
+    return f"optimized_{event_id}_{render_id}_{name}.{FORMAT_OPTIONS[image_format][1]}"
+
 
-    # 3. Генерируем новый путь для оптимизированного файла
-    optimized_key = s3_key.replace(filename_old, f"optimized_{filename_old.split('.')[0]}.webp")
-    filename_new = optimized_key.split("/")[-1]
+async def _upload_variants(event_id, rendered: dict[str, dict]) -> dict[str, dict]:
+    render_id = uuid.uuid4().hex[:12]
+    uploads = [
+        (name, image_format, _variant_key(event_id, render_id, name, image_format), output)
+        for name, variant in rendered.items()
+        for image_format, output in variant["files"].items()
+    ]
+    results = await asyncio.gather(
+        *(s3_client.put_file(s3_key=s3_key, file=output) for _, _, s3_key, output in uploads),
+        return_exceptions=True,
+    )
 
-    # 4. Загружаем обработанный файл обратно в S3 (ensure bytes are passed)
-    url = await s3_client.upload_file(
-        filename=filename_new,
-        file=output.getvalue(),
-    ) 
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        # don't leave a partial set of variants behind
+        await asyncio.gather(
+            *(s3_client.delete_file(s3_key=url.split("/")[-1]) for url in results if isinstance(url, str)),
+            return_exceptions=True,
+        )
+        raise errors[0]
 
-    await s3_client.delete_file(s3_key=filename_old)  # delete old version of image 
+    photo_variants = {
+        name: {"width": variant["width"], "height": variant["height"], "urls": {}}
+        for name, variant in rendered.items()
+    }
+    for (name, image_format, _, _), url in zip(uploads, results):
+        photo_variants[name]["urls"][image_format] = url
+    return photo_variants
+
+
+def _render_file(original) -> dict[str, dict]:
+    # 2. Декодируем сразу в размере, близком к самому большому варианту
+    largest_box = max(settings.IMAGE_VARIANTS.values(), key=lambda size: size[0] * size[1])
+    img = decode_for_box(original, largest_box)
+
+    # 3. Все размеры и форматы из одного декодированного изображения
+    return render_variants(img, settings.IMAGE_VARIANTS, settings.IMAGE_VARIANT_FORMATS)
+
+
+async def _prepare_photo(event_id, s3_key: str, executor: Optional[Executor] = None) -> dict:
+    """ Downloads the original, renders and uploads its variants; returns
+    the new photo columns plus the key of the original to delete """
+    filename_old = s3_key.split("/")[-1]
+    logger.info(f'EXTRACTED FILENAME: {filename_old}')
     
-    # Create a new async engine/sessionmaker inside the worker process to
-    # ensure connections are bound to the current event loop and avoid
-    # 'Future attached to a different loop' issues.
-    engine = create_async_engine(settings.DATABASE_ASYNC_URL)
-    LocalSession = async_sessionmaker(bind=engine, expire_on_commit=False)
+    with tempfile.SpooledTemporaryFile(max_size=settings.IMAGE_SPOOL_MAX_SIZE) as original:
+        await s3_client.download_fileobj(filename_old, original)
+        original.seek(0)
+
+        # Pillow releases the GIL while decoding, resizing and encoding
+        loop = asyncio.get_running_loop()
+        rendered = await loop.run_in_executor(executor, _render_file, original)
+
+    # 4. Загружаем варианты в S3 параллельно
+    photo_variants = await _upload_variants(event_id, rendered)
+
+    # the largest variant in the first format stays the plain `photo` for old clients
+    largest = max(photo_variants.values(), key=lambda variant: variant["width"] * variant["height"])
+    return {
+        "photo": largest["urls"][settings.IMAGE_VARIANT_FORMATS[0]],
+        "photo_variants": photo_variants,
+        "original": filename_old,
+    }
+
+
+async def _store_photos(updates: list[dict]) -> list[UUID]:
+    """ Writes the optimized photos, dicts hold event_id, source (the photo
+    the variants were rendered from), photo and photo_variants. A shared
+    (content-addressed) photo is written to its photos row and to every event
+    using it. Rows whose photo changed since `source` are skipped, so a photo
+    replaced meanwhile is never overwritten. Returns the ids of the updated
+    events """
+    # the worker-lifetime engine: its pool is bound to the runtime loop
+    async with runtime.session_factory() as session:
+        async with session.begin():
+            event_dal = EventsDAL(session)
+            photo_hashes = await event_dal.get_photo_hashes([update["event_id"] for update in updates])
+
+            by_event = []
+            by_hash = []
+            hashes = set()
+            for update in updates:
+                if update["event_id"] not in photo_hashes:
+                    continue
+                content_hash = photo_hashes[update["event_id"]]
+                if content_hash is None:
+                    by_event.append(update)
+                elif content_hash not in hashes:
+                    # one rendering per shared photo, later duplicates count as not updated
+                    hashes.add(content_hash)
+                    by_hash.append({**update, "content_hash": content_hash})
+
+            updated_event_ids = []
+            if by_event:
+                updated_event_ids += await event_dal.update_photos(by_event)
+            if by_hash:
+                photos_dal = PhotosDAL(session)
+                updated_hashes = set(await photos_dal.update_photos(by_hash))
+                stored = [update for update in by_hash if update["content_hash"] in updated_hashes]
+                if stored:
+                    await event_dal.update_photos_by_hash(stored)
+                    updated_event_ids += [update["event_id"] for update in stored]
+
+    return updated_event_ids
+
+
+def _variant_keys(photo_variants: dict[str, dict]) -> list[str]:
+    return [url.split("/")[-1] for variant in photo_variants.values() for url in variant["urls"].values()]
+
+
+async def _discard_variants(prepared: list[dict]):
+    """ Deletes variants rendered for photos that were replaced meanwhile """
+    await asyncio.gather(
+        *(s3_client.delete_file(s3_key=key) for result in prepared for key in _variant_keys(result["photo_variants"])),
+        return_exceptions=True,
+    )
+
+
+async def _optimize_image(event_id: uuid.UUID, s3_key: str) -> Optional[UUID]:
+    prepared = await _prepare_photo(event_id, s3_key)
+
+    updated_event_ids = await _store_photos([{
+        "event_id": uuid.UUID(str(event_id)),
+        "source": s3_key,
+        "photo": prepared["photo"],
+        "photo_variants": prepared["photo_variants"],
+    }])
+
+    if not updated_event_ids:
+        await _discard_variants([prepared])
+        return None
+
+    # only once the event points at the variants, like the batch path
+    await s3_client.delete_file(s3_key=prepared["original"])  # delete old version of image
+    return updated_event_ids[0]
+
+
+async def optimize_images_batch_logic(items: list[tuple[str, str]]) -> list[UUID]:
+    """ Optimizes many (event_id, s3_key) pairs in parallel and stores all
+    results in a single transaction """
+    executor = ThreadPoolExecutor(max_workers=settings.IMAGE_BATCH_CONCURRENCY, thread_name_prefix="resize")
+    # also bounds how many originals are buffered at once
+    semaphore = asyncio.Semaphore(settings.IMAGE_BATCH_CONCURRENCY)
+
+    async def prepare(event_id, s3_key: str) -> dict:
+        async with semaphore:
+            return await _prepare_photo(event_id, s3_key, executor)
 
     try:
-        async with LocalSession() as session:
-            async with session.begin():
-                event_dal = EventsDAL(session)
-                updated_event_id = await event_dal.update_photo(event_id=event_id, photo=url)
+        results = await asyncio.gather(*(prepare(event_id, s3_key) for event_id, s3_key in items), return_exceptions=True)
     finally:
-        # Dispose the engine to close pool connections bound to this loop
-        await engine.dispose()
+        executor.shutdown(wait=False)
 
-    return updated_event_id    
-            
+    updates = []
+    prepared = {}
+    for (event_id, s3_key), result in zip(items, results):
+        if isinstance(result, BaseException):
+            logger.error(f'EVENT_ID: {event_id} | S3_KEY: {s3_key} | FAILED: {result!r}')
+            continue
+        event_id = uuid.UUID(str(event_id))
+        updates.append({
+            "event_id": event_id,
+            "source": s3_key,
+            "photo": result["photo"],
+            "photo_variants": result["photo_variants"],
+        })
+        prepared[event_id] = result
 
+    if not updates:
+        return []
+
+    updated_event_ids = await _store_photos(updates)
+
+    # originals of replaced photos belong to whoever replaced them
+    updated = set(updated_event_ids)
+    await asyncio.gather(
+        *(s3_client.delete_file(s3_key=result["original"]) for event_id, result in prepared.items() if event_id in updated),
+        return_exceptions=True,
+    )
+    await _discard_variants([result for event_id, result in prepared.items() if event_id not in updated])
+
+    await invalidate_feed_cache(all_pages=True)
+    return updated_event_ids
 
-    
 
 @celery.task(name="optimize_image_task")
 def optimize_image_task(event_id: uuid.UUID, s3_key: str) -> Optional[UUID]:
     # 'https://{self.static_domain}/{unique_filename}'
-    return asyncio.run(optimize_image_logic(event_id, s3_key))
\ No newline at end of file
+    return runtime.run(optimize_image_logic(event_id, s3_key))
+
+
+@celery.task(name="optimize_images_batch_task")
+def optimize_images_batch_task(items: list[tuple[str, str]]) -> list[UUID]:
+    # for backfills and upload bursts: items are (event_id, s3_key) pairs
+    return runtime.run(optimize_images_batch_logic(items))
@@ -1,12 +1,17 @@
 import mimetypes
+import asyncio
+import hashlib
+import io
+from typing import AsyncIterator, BinaryIO
 from aiobotocore.session import get_session
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, AsyncExitStack
 from botocore.config import Config
+from botocore.exceptions import ClientError
 import certifi
 from fastapi import UploadFile
-import datetime
 from settings import settings
 
+
 class S3Client:
     def __init__(
             self,
@@ -15,6 +20,9 @@ class S3Client:
             endpoint_url: str,
             bucket_name: str,
             static_domain: str,
+            max_pool_connections: int = 10,
+            multipart_part_size: int = 8 * 1024 * 1024,
+            download_chunk_size: int = 1024 * 1024,
     ):
         self.config = {
             "aws_access_key_id": access_key,
@@ -23,48 +31,136 @@ class S3Client:
         }
         self.bucket_name = bucket_name
         self.static_domain = static_domain
+        # S3 requires every multipart part except the last to be >= 5MB
+        self.multipart_part_size = max(multipart_part_size, 5 * 1024 * 1024)
+        self.download_chunk_size = download_chunk_size
         self.session = get_session()
 
         self.s3_config = Config(
             signature_version="s3v4",
-            s3={'addressing_style': "path"}
+            s3={'addressing_style': "path"},
+            max_pool_connections=max_pool_connections,
         )
 
+        # long-lived client opened by start(); bound to the loop start() ran on
+        self._client = None
+        self._exit_stack: AsyncExitStack | None = None
+
+    def _create_client(self):
+        return self.session.create_client("s3", config=self.s3_config, verify=certifi.where(), **self.config)
+
+    async def start(self):
+        """ Open the shared client, reused by every operation until close() """
+        if self._client is not None:
+            return
+        self._exit_stack = AsyncExitStack()
+        self._client = await self._exit_stack.enter_async_context(self._create_client())
+
+    async def close(self):
+        if self._exit_stack is not None:
+            await self._exit_stack.aclose()
+        self._client = None
+        self._exit_stack = None
+
     @asynccontextmanager
     async def get_client(self):
-        async with self.session.create_client("s3", config=self.s3_config, verify=certifi.where(), **self.config) as client:
+        if self._client is not None:
+            yield self._client
+            return
+        # not started (e.g. one-off scripts): fall back to a client per operation
+        async with self._create_client() as client:
             yield client   
 
-    async def get_file(self, s3_key: str) -> bytes:
+    async def iter_file(self, s3_key: str) -> AsyncIterator[bytes]:
+        """ Yields the object in download_chunk_size chunks """
         async with self.get_client() as client:
             response = await client.get_object(
                  Bucket=self.bucket_name,
                  Key=s3_key,
             )
-            async with response["Body"] as stream:
-                 return await stream.read()    
+            # entering the body yields the raw aiohttp response, iterate the wrapper itself
+            body = response["Body"]
+            async with body:
+                async for chunk in body.iter_chunks(self.download_chunk_size):
+                    yield chunk
 
-    async def upload_file(
-            self,
-            filename: str,
-            file: bytes,
-    ) -> str:
-        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-        extension = filename.split(".")[-1]
-        name = filename.split(".")[0]
-        unique_filename = f"{name}-{timestamp}.{extension}"
-
-        content_type, _ = mimetypes.guess_type(filename)
-        
+    async def download_fileobj(self, s3_key: str, fileobj: BinaryIO):
+        async for chunk in self.iter_file(s3_key):
+            fileobj.write(chunk)
+
+    async def put_file(self, s3_key: str, file: bytes | BinaryIO) -> str:
+        """ Uploads under exactly this key, overwriting any existing object """
+        content_type, _ = mimetypes.guess_type(s3_key)
+        if isinstance(file, (bytes, bytearray)):
+            file = io.BytesIO(file)
+
+        await self._upload_stream(key=s3_key, file=file, content_type=content_type)
+        return self.get_public_url(s3_key)
+
+    async def hash_file(self, file: BinaryIO) -> str:
+        """ sha256 of the rest of the stream, read in chunks; the stream is
+        rewound afterwards so it can be uploaded """
+        def digest() -> str:
+            start = file.tell()
+            sha256 = hashlib.sha256()
+            while chunk := file.read(self.download_chunk_size):
+                sha256.update(chunk)
+            file.seek(start)
+            return sha256.hexdigest()
+
+        return await asyncio.to_thread(digest)
+
+    async def _upload_stream(self, key: str, file: BinaryIO, content_type: str | None):
+        """ Single PUT for bodies up to one part, otherwise a multipart
+        upload that only ever holds one part in memory """
+        extra_args = {"ACL": "public-read"}
+        if content_type:
+            extra_args["ContentType"] = content_type
+
+        chunk = await asyncio.to_thread(file.read, self.multipart_part_size)
         async with self.get_client() as client:
+            if len(chunk) < self.multipart_part_size:
                 await client.put_object(
                     Bucket=self.bucket_name,
-                    Key=unique_filename,
-                    Body=file,
-                    ContentType=content_type,
-                    ACL="public-read"
+                    Key=key,
+                    Body=chunk,
+                    **extra_args,
+                )
+                return
+
+            upload = await client.create_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=key,
+                **extra_args,
+            )
+            upload_id = upload["UploadId"]
+            parts = []
+            try:
+                while chunk:
+                    part_number = len(parts) + 1
+                    part = await client.upload_part(
+                        Bucket=self.bucket_name,
+                        Key=key,
+                        UploadId=upload_id,
+                        PartNumber=part_number,
+                        Body=chunk,
+                    )
+                    parts.append({"ETag": part["ETag"], "PartNumber": part_number})
+                    chunk = await asyncio.to_thread(file.read, self.multipart_part_size)
+
+                await client.complete_multipart_upload(
+                    Bucket=self.bucket_name,
+                    Key=key,
+                    UploadId=upload_id,
+                    MultipartUpload={"Parts": parts},
                 )
-        return f'https://{self.static_domain}/{unique_filename}' 
+            except Exception:
+                await client.abort_multipart_upload(
+                    Bucket=self.bucket_name,
+                    Key=key,
+                    UploadId=upload_id,
+                )
+                raise
 
     async def delete_file(self, s3_key: str):
          async with self.get_client() as client:
@@ -72,11 +168,53 @@ class S3Client:
                   Bucket=self.bucket_name,
                   Key=s3_key,
              )  
+
+    async def head_file(self, s3_key: str) -> dict:
+        """ Object metadata; raises FileNotFoundError if there is no such
+        object, any other storage error propagates """
+        async with self.get_client() as client:
+            try:
+                return await client.head_object(
+                    Bucket=self.bucket_name,
+                    Key=s3_key,
+                )
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                    raise FileNotFoundError(s3_key) from e
+                raise
+
+    async def generate_presigned_upload(
+            self,
+            s3_key: str,
+            content_type: str,
+            max_size: int,
+            expires_in: int,
+    ) -> dict:
+        """ Presigned POST that lets the browser upload straight to the bucket;
+        S3 itself enforces the content type and the size limit """
+        async with self.get_client() as client:
+            return await client.generate_presigned_post(
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                Fields={"Content-Type": content_type, "acl": "public-read"},
+                Conditions=[
+                    {"Content-Type": content_type},
+                    {"acl": "public-read"},
+                    ["content-length-range", 1, max_size],
+                ],
+                ExpiresIn=expires_in,
+            )
+
+    def get_public_url(self, s3_key: str) -> str:
+        return f'https://{self.static_domain}/{s3_key}'
 s3_client = S3Client(
     access_key=settings.ACCESS_KEY,
     secret_key=settings.SECRET_KEY,
     endpoint_url=settings.ENDPOINT_URL,
     bucket_name=settings.BUCKET_NAME,
     static_domain=settings.STATIC_DOMAIN,
+    max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+    multipart_part_size=settings.S3_MULTIPART_PART_SIZE,
+    download_chunk_size=settings.S3_DOWNLOAD_CHUNK_SIZE,
 )
 
@@ -0,0 +1,18 @@
+from services.celery_app import celery
+from services.s3_service import s3_client
+from services.worker_runtime import runtime
+from celery.utils.log import get_task_logger
+
+logger = get_task_logger(__name__)
+
+
+@celery.task(
+    name="delete_s3_object_task",
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    max_retries=8,
+)
+def delete_s3_object_task(s3_key: str):
+    # cleanup of objects the API could not delete inline; retried until S3 answers
+    logger.info(f'DELETE S3_KEY: {s3_key}')
+    runtime.run(s3_client.delete_file(s3_key=s3_key))
@@ -0,0 +1,63 @@
+import asyncio
+from typing import Any, Coroutine
+from celery.signals import worker_process_init, worker_process_shutdown
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine
+from services.s3_service import s3_client
+from settings import settings
+
+
+class WorkerRuntime:
+    """ Event loop, DB engine and S3 client living as long as a worker process.
+
+    Tasks run their coroutines on the same loop, so pooled connections bound
+    to it are reused instead of being opened and torn down per task. One
+    runtime serves one thread: use the prefork (default) or solo pool. """
+
+    def __init__(self):
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.engine: AsyncEngine | None = None
+        self.session_factory: async_sessionmaker | None = None
+
+    def start(self):
+        if self.loop is not None:
+            return
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.engine = create_async_engine(
+            settings.DATABASE_ASYNC_URL,
+            pool_size=settings.WORKER_DB_POOL_SIZE,
+            pool_pre_ping=True,
+        )
+        self.session_factory = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+        self.loop.run_until_complete(s3_client.start())
+
+    def run(self, coro: Coroutine[Any, Any, Any]) -> Any:
+        # started lazily too, for pools that don't send worker_process_init
+        if self.loop is None:
+            self.start()
+        return self.loop.run_until_complete(coro)
+
+    def stop(self):
+        if self.loop is None:
+            return
+        try:
+            self.loop.run_until_complete(s3_client.close())
+            self.loop.run_until_complete(self.engine.dispose())
+        finally:
+            self.loop.close()
+            self.loop = None
+            self.engine = None
+            self.session_factory = None
+
+
+runtime = WorkerRuntime()
+
+
+@worker_process_init.connect
+def _start_runtime(**kwargs):
+    runtime.start()
+
+
+@worker_process_shutdown.connect
+def _stop_runtime(**kwargs):
+    runtime.stop()
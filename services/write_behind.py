@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from typing import Optional
+from beanie import Document
+from pymongo.errors import BulkWriteError
+
+
+log = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class WriteBehindBuffer:
+    """ Bounded in-memory queue of documents written to Mongo in batches by
+    a background task. Documents must carry their id already, so a retried
+    batch can't store anything twice """
+
+    def __init__(
+            self,
+            document_model: type[Document],
+            max_batch: int,
+            flush_interval: float,
+            max_pending: int,
+            retry_backoff_max: float = 5.0,
+    ):
+        self.document_model = document_model
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.retry_backoff_max = retry_backoff_max
+        self._queue: asyncio.Queue[Document] = asyncio.Queue(maxsize=max_pending)
+        # the batch taken off the queue and not yet written; close() writes it
+        self._batch: list[Document] = []
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.rejected = 0
+        self.batches = 0
+
+    def put_nowait(self, document: Document) -> bool:
+        """ Queues the document; False when the buffer is full, so callers
+        can push back instead of growing memory without bound """
+        try:
+            self._queue.put_nowait(document)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        return True
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch = [await self._queue.get()]
+            # flush on max_batch or flush_interval after the first document, whichever comes first
+            deadline = loop.time() + self.flush_interval
+            while len(self._batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._write(self._batch)
+            self._batch = []
+
+    async def _write(self, batch: list[Document], attempts: Optional[int] = None):
+        """ insert_many with retries; attempts=None retries until it succeeds.
+        While it retries the queue fills up and put_nowait() starts refusing """
+        backoff = 0.1
+        attempt = 0
+        while batch:
+            attempt += 1
+            try:
+                await self.document_model.insert_many(batch, ordered=False)
+                self.written += len(batch)
+                self.batches += 1
+                return
+            except BulkWriteError as e:
+                # documents stored by an earlier attempt come back as duplicates
+                failed = {
+                    error["index"] for error in e.details.get("writeErrors", [])
+                    if error.get("code") != DUPLICATE_KEY_ERROR
+                }
+                self.written += len(batch) - len(failed)
+                batch = [document for index, document in enumerate(batch) if index in failed]
+                if not batch:
+                    self.batches += 1
+                    return
+                log.warning(f"Write-behind insert of {len(batch)} documents failed: {e}")
+            except Exception as e:
+                log.warning(f"Write-behind insert of {len(batch)} documents failed: {e}")
+
+            if attempts is not None and attempt >= attempts:
+                log.error(f"Write-behind dropped {len(batch)} documents")
+                return
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.retry_backoff_max)
+
+    async def close(self, attempts: int = 3):
+        """ Stops the background task and writes everything still buffered """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        pending = self._batch
+        self._batch = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for start in range(0, len(pending), self.max_batch):
+            await self._write(pending[start:start + self.max_batch], attempts=attempts)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._queue.qsize() + len(self._batch),
+            "written": self.written,
+            "rejected": self.rejected,
+            "batches": self.batches,
+        }
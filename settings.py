@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from typing import Literal
 import asyncpg
 
 
@@ -21,13 +22,75 @@ class Settings(BaseSettings):
     REDIS_HOST: str
     REDIS_PORT: str
     REDIS_PASS: str
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: float = 1.0
+    REDIS_SOCKET_TIMEOUT: float = 0.5
+    REDIS_CONNECT_TIMEOUT: float = 0.5
+    REDIS_BREAKER_FAILURE_THRESHOLD: int = 3
+    REDIS_BREAKER_RESET_TIMEOUT: float = 10.0
+    REDIS_HEALTH_PROBE_INTERVAL: float = 5.0
+
+    # in-process cache tier in front of redis
+    LOCAL_CACHE_MAX_ITEMS: int = 1024
+    LOCAL_CACHE_MAX_BYTES: int = 16 * 1024 * 1024
+    LOCAL_CACHE_TTL: float = 5.0
     
     # jwt 
     SECRET_KEY: str
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
+    PRINCIPAL_CACHE_TTL: int = 60
+
+    # password hashing; every running Argon2 job holds memory_cost KiB
+    # (~100MB with the default profile). Profiles: low / default / high,
+    # the explicit costs override the chosen profile (see `python hashing.py`)
+    HASHING_PROFILE: Literal["low", "default", "high"] = "default"
+    HASHING_TIME_COST: int | None = None
+    HASHING_MEMORY_COST: int | None = None
+    HASHING_PARALLELISM: int | None = None
+    HASHING_MAX_WORKERS: int = 4
+    HASHING_MAX_WAITING: int = 64
 
     APP_PORT: int
+    # uvicorn worker processes; more than one needs a shared CHAT_MANAGER
+    APP_WORKERS: int = 1
+
+    # events feed
+    EVENTS_PAGE_SIZE: int = 10
+    EVENTS_MAX_PAGE_SIZE: int = 50
+
+    # chat history
+    CHAT_HISTORY_PAGE_SIZE: int = 50
+    CHAT_HISTORY_MAX_PAGE_SIZE: int = 100
+    # how Socket.IO emits reach clients connected to other processes / nodes:
+    # memory (single process), redis (pub/sub) or amqp (RabbitMQ)
+    CHAT_MANAGER: Literal["memory", "redis", "amqp"] = "memory"
+    # defaults to the REDIS_* settings or CELERY_BROKER_URL
+    CHAT_MANAGER_URL: str | None = None
+    CHAT_MANAGER_CHANNEL: str = "chat"
+    # messages are broadcast at once and written to Mongo in batches of up
+    # to CHAT_WRITE_BATCH_SIZE, at the latest CHAT_WRITE_FLUSH_INTERVAL
+    # seconds after the first one; once CHAT_WRITE_MAX_PENDING are waiting
+    # new messages are refused
+    CHAT_WRITE_BATCH_SIZE: int = 100
+    CHAT_WRITE_FLUSH_INTERVAL: float = 0.2
+    CHAT_WRITE_MAX_PENDING: int = 10000
+    # latest messages kept in memory to serve history pages without Mongo
+    CHAT_RECENT_MESSAGES: int = 500
+    CHAT_RECENT_REWARM_INTERVAL: float = 60.0
+    # token buckets: messages per second and burst, per connection and per sender
+    CHAT_RATE_PER_SID: float = 2.0
+    CHAT_BURST_PER_SID: int = 10
+    CHAT_RATE_PER_SENDER: float = 3.0
+    CHAT_BURST_PER_SENDER: int = 15
+    # characters of message text / bytes of one incoming socket packet
+    CHAT_MAX_MESSAGE_LENGTH: int = 2000
+    CHAT_MAX_PACKET_SIZE: int = 16 * 1024
+    # packets waiting in a client's send queue: above the first broadcasts to
+    # it are dropped, above the second it is disconnected
+    CHAT_SLOW_CONSUMER_QUEUE: int = 100
+    CHAT_MAX_SEND_QUEUE: int = 1000
+    CHAT_SLOW_CONSUMER_INTERVAL: float = 1.0
 
     # s3 service
     ACCESS_KEY: str
@@ -35,10 +98,29 @@ class Settings(BaseSettings):
     ENDPOINT_URL: str
     BUCKET_NAME: str
     STATIC_DOMAIN: str
+    S3_MAX_POOL_CONNECTIONS: int = 50
+    S3_MULTIPART_PART_SIZE: int = 8 * 1024 * 1024
+    S3_DOWNLOAD_CHUNK_SIZE: int = 1024 * 1024
+    UPLOAD_MAX_SIZE: int = 20 * 1024 * 1024
+    PRESIGNED_UPLOAD_EXPIRES: int = 600
+    # originals up to this size are buffered in memory by the resize worker, larger ones spill to disk
+    IMAGE_SPOOL_MAX_SIZE: int = 16 * 1024 * 1024
+    # responsive variants produced by the resize worker: name -> max (width, height)
+    IMAGE_VARIANTS: dict[str, tuple[int, int]] = {
+        "thumbnail": (320, 320),
+        "medium": (960, 960),
+        "full": (1920, 1080),
+    }
+    # webp / jpeg / avif (avif needs a Pillow build with AVIF support)
+    IMAGE_VARIANT_FORMATS: list[str] = ["webp", "jpeg"]
 
     # Celery 
     CELERY_BROKER_URL: str
     CELERY_RESULT_BACKEND: str
+    WORKER_DB_POOL_SIZE: int = 5
+    IMAGE_QUEUE: str = "images"
+    # images processed in parallel by one optimize_images_batch_task
+    IMAGE_BATCH_CONCURRENCY: int = 4
 
     
     @property
@@ -0,0 +1,31 @@
+import os
+
+# settings are read at import time; the tests never connect to these services
+TEST_ENV = {
+    "DB_USER": "test",
+    "DB_PASS": "test",
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "DB_DB": "test",
+    "MONGO_ROOT_USER": "test",
+    "MONGO_ROOT_PASS": "test",
+    "MONGO_APP_USER": "test",
+    "MONGO_APP_PASS": "test",
+    "MONGO_DB": "test",
+    "REDIS_HOST": "localhost",
+    "REDIS_PORT": "6379",
+    "REDIS_PASS": "test",
+    "SECRET_KEY": "test",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "APP_PORT": "8000",
+    "ACCESS_KEY": "test",
+    "ENDPOINT_URL": "http://localhost:5000",
+    "BUCKET_NAME": "test",
+    "STATIC_DOMAIN": "static.test",
+    "CELERY_BROKER_URL": "memory://",
+    "CELERY_RESULT_BACKEND": "cache+memory://",
+}
+
+for name, value in TEST_ENV.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,469 @@
+import copy
+import datetime
+import hashlib
+import io
+import uuid
+from contextlib import asynccontextmanager
+import pytest
+from fastapi import UploadFile
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from api.actions import events
+from api.schemas import EventAddDTO
+from db.dals import PhotosDAL
+from db.models.models import EventsOrm, PhotosOrm
+from services.redis_service import RedisCircuitBreaker
+
+
+class FakeDatabase:
+    """ photos and events rows as dicts; a failed transaction restores them """
+
+    def __init__(self):
+        self.photos = {}
+        self.events = {}
+        self.fail_insert = False
+        self.fail_update = False
+        self.fail_release = False
+        self.fail_commit = False
+        # runs once after the next photo lookup, to interleave another request
+        self.after_lookup = None
+
+
+class FakeSession:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+
+    @asynccontextmanager
+    async def begin(self):
+        snapshot = copy.deepcopy((self.db.photos, self.db.events))
+        try:
+            yield
+            if self.db.fail_commit:
+                raise ConnectionError("commit failed")
+        except BaseException:
+            self.db.photos, self.db.events = snapshot
+            raise
+
+
+class FakePhotosDAL:
+    def __init__(self, db_session: FakeSession):
+        self.db = db_session.db
+
+    async def get_photo(self, content_hash: str):
+        row = self.db.photos.get(content_hash)
+        if self.db.after_lookup is not None:
+            after_lookup, self.db.after_lookup = self.db.after_lookup, None
+            after_lookup()
+        return PhotosOrm(**row) if row else None
+
+    async def acquire_photo(self, content_hash: str, photo: str):
+        created = content_hash not in self.db.photos
+        if created:
+            self.db.photos[content_hash] = {"content_hash": content_hash, "photo": photo, "photo_variants": None}
+        return PhotosOrm(**self.db.photos[content_hash]), created
+
+    async def delete_unreferenced(self, content_hash: str):
+        if self.db.fail_release:
+            raise IntegrityError("DELETE FROM photos", {}, Exception("photo is still referenced"))
+        if any(event["photo_hash"] == content_hash for event in self.db.events.values()):
+            return None
+        row = self.db.photos.pop(content_hash, None)
+        return PhotosOrm(**row) if row else None
+
+
+class FakeEventsDAL:
+    def __init__(self, db_session: FakeSession):
+        self.db = db_session.db
+
+    async def create_event(self, title, text, author_id, photo=None, photo_variants=None, photo_hash=None):
+        if self.db.fail_insert:
+            raise IntegrityError("INSERT INTO events", {}, Exception("insert failed"))
+        now = datetime.datetime.now(datetime.timezone.utc)
+        row = {
+            "event_id": uuid.uuid4(),
+            "title": title,
+            "text": text,
+            "author_id": author_id,
+            "photo": photo,
+            "photo_variants": photo_variants,
+            "photo_hash": photo_hash,
+            "likes": 0,
+            "created_at": now,
+            "updated_at": now,
+        }
+        self.db.events[row["event_id"]] = row
+        return EventsOrm(**row)
+
+    async def get_event_by_id(self, event_id):
+        row = self.db.events.get(event_id)
+        return EventsOrm(**row) if row else None
+
+    async def delete_event(self, event_id):
+        return event_id if self.db.events.pop(event_id, None) else None
+
+    async def update_photo(self, event_id, photo, photo_variants=None, photo_hash=None):
+        if self.db.fail_update:
+            raise IntegrityError("UPDATE events", {}, Exception("update failed"))
+        row = self.db.events.get(event_id)
+        if row is None:
+            return None
+        row.update(photo=photo, photo_variants=photo_variants, photo_hash=photo_hash)
+        return event_id
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+        self.puts = []
+        self.deleted = []
+        self.fail_put = False
+        self.fail_head = False
+
+    async def hash_file(self, file) -> str:
+        digest = hashlib.sha256(file.read()).hexdigest()
+        file.seek(0)
+        return digest
+
+    async def put_file(self, s3_key: str, file) -> str:
+        if self.fail_put:
+            raise ConnectionError("storage down")
+        self.puts.append(s3_key)
+        self.objects[s3_key] = file.read()
+        return self.get_public_url(s3_key)
+
+    async def delete_file(self, s3_key: str):
+        self.deleted.append(s3_key)
+        self.objects.pop(s3_key, None)
+
+    async def head_file(self, s3_key: str) -> dict:
+        if self.fail_head:
+            raise ConnectionError("storage down")
+        if s3_key not in self.objects:
+            raise FileNotFoundError(s3_key)
+        return {"ContentLength": len(self.objects[s3_key])}
+
+    def get_public_url(self, s3_key: str) -> str:
+        return f"https://static.test/{s3_key}"
+
+
+class FakeTask:
+    def __init__(self):
+        self.calls = []
+
+    def delay(self, **kwargs):
+        self.calls.append(kwargs)
+        return "task"
+
+
+@pytest.fixture
+def db(monkeypatch) -> FakeDatabase:
+    async def invalidate_feed_cache(all_pages: bool = False):
+        pass
+
+    monkeypatch.setattr(events, "PhotosDAL", FakePhotosDAL)
+    monkeypatch.setattr(events, "EventsDAL", FakeEventsDAL)
+    monkeypatch.setattr(events, "invalidate_feed_cache", invalidate_feed_cache)
+    monkeypatch.setattr(events, "optimize_image_task", FakeTask())
+    monkeypatch.setattr(events, "delete_s3_object_task", FakeTask())
+    return FakeDatabase()
+
+
+@pytest.fixture
+def s3(monkeypatch) -> FakeS3:
+    s3 = FakeS3()
+    monkeypatch.setattr(events, "s3_client", s3)
+    return s3
+
+
+PHOTO = b"photo bytes"
+PHOTO_HASH = hashlib.sha256(PHOTO).hexdigest()
+PHOTO_KEY = f"{PHOTO_HASH}.jpg"
+
+
+def _event() -> EventAddDTO:
+    return EventAddDTO(title="title", text="text", author_id=uuid.uuid4())
+
+
+def _upload() -> UploadFile:
+    return UploadFile(file=io.BytesIO(PHOTO), filename="cat.JPG")
+
+
+def _variants(name: str) -> dict:
+    return {"full": {"width": 1, "height": 1, "urls": {"webp": f"https://static.test/{name}_full.webp"}}}
+
+
+@pytest.mark.asyncio
+async def test_first_upload_is_stored_and_optimized(db, s3):
+    created = await events._create_new_event(_event(), _upload(), FakeSession(db))
+
+    assert s3.puts == [PHOTO_KEY]
+    assert created.photo == f"https://static.test/{PHOTO_KEY}"
+    assert db.events[created.event_id]["photo_hash"] == PHOTO_HASH
+    assert events.optimize_image_task.calls == [{"event_id": created.event_id, "s3_key": created.photo}]
+
+
+@pytest.mark.asyncio
+async def test_upload_is_skipped_when_the_hash_is_stored(db, s3):
+    db.photos[PHOTO_HASH] = {
+        "content_hash": PHOTO_HASH,
+        "photo": "https://static.test/optimized.webp",
+        "photo_variants": _variants("optimized"),
+    }
+
+    created = await events._create_new_event(_event(), _upload(), FakeSession(db))
+
+    assert s3.puts == []
+    # the event shares the already optimized photo and is not optimized again
+    assert created.photo == "https://static.test/optimized.webp"
+    assert db.events[created.event_id]["photo_variants"] == _variants("optimized")
+    assert events.optimize_image_task.calls == []
+
+
+@pytest.mark.asyncio
+async def test_uploaded_object_is_discarded_when_the_insert_fails(db, s3):
+    db.fail_insert = True
+
+    with pytest.raises(IntegrityError):
+        await events._create_new_event(_event(), _upload(), FakeSession(db))
+
+    assert s3.deleted == [PHOTO_KEY]
+    assert db.photos == {}
+    assert db.events == {}
+
+
+@pytest.mark.asyncio
+async def test_discard_keeps_an_object_a_concurrent_upload_registered(db, s3):
+    db.photos[PHOTO_HASH] = {"content_hash": PHOTO_HASH, "photo": PHOTO_KEY, "photo_variants": None}
+
+    await events._discard_upload(PHOTO_HASH, PHOTO_KEY, FakeSession(db))
+
+    assert s3.deleted == []
+
+
+@pytest.mark.asyncio
+async def test_failed_reupload_deletes_the_event_again(db, s3):
+    db.photos[PHOTO_HASH] = {"content_hash": PHOTO_HASH, "photo": PHOTO_KEY, "photo_variants": None}
+    # the last event sharing the photo is deleted between our lookup and insert
+    db.after_lookup = lambda: db.photos.pop(PHOTO_HASH)
+    s3.fail_put = True
+
+    with pytest.raises(ConnectionError):
+        await events._create_new_event(_event(), _upload(), FakeSession(db))
+
+    assert db.events == {}
+    assert db.photos == {}
+    assert events.optimize_image_task.calls == []
+
+
+@pytest.mark.asyncio
+async def test_objects_are_kept_while_another_event_references_them(db, s3):
+    db.photos[PHOTO_HASH] = {"content_hash": PHOTO_HASH, "photo": f"https://static.test/{PHOTO_KEY}", "photo_variants": _variants("shared")}
+    first = await events._create_new_event(_event(), _upload(), FakeSession(db))
+    second = await events._create_new_event(_event(), _upload(), FakeSession(db))
+
+    assert await events._delete_event(first.event_id, FakeSession(db)) == first.event_id
+    assert s3.deleted == []
+    assert PHOTO_HASH in db.photos
+
+    assert await events._delete_event(second.event_id, FakeSession(db)) == second.event_id
+    assert sorted(s3.deleted) == sorted([PHOTO_KEY, "shared_full.webp"])
+    assert db.photos == {}
+
+
+@pytest.mark.asyncio
+async def test_release_keeps_objects_when_an_insert_races_the_delete(db, s3):
+    db.fail_release = True
+    released = EventsOrm(photo=f"https://static.test/{PHOTO_KEY}", photo_variants=None, photo_hash=PHOTO_HASH)
+
+    await events._release_photo(released, FakeSession(db))
+
+    assert s3.deleted == []
+
+
+@pytest.mark.asyncio
+async def test_release_of_an_unhashed_photo_deletes_its_objects(db, s3):
+    released = EventsOrm(photo="https://static.test/legacy.jpg", photo_variants=_variants("legacy"), photo_hash=None)
+
+    await events._release_photo(released, FakeSession(db))
+
+    assert sorted(s3.deleted) == ["legacy.jpg", "legacy_full.webp"]
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalars(self):
+        return self
+
+    def one_or_none(self):
+        return self.value
+
+
+class RecordingSession:
+    def __init__(self, *results):
+        self.results = list(results)
+        self.statements = []
+
+    async def execute(self, statement, *args):
+        self.statements.append(statement)
+        return FakeResult(self.results.pop(0))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("inserted, created", [(PHOTO_HASH, True), (None, False)])
+async def test_acquire_photo_reports_whether_it_inserted(inserted, created):
+    stored = PhotosOrm(content_hash=PHOTO_HASH, photo=PHOTO_KEY)
+    session = RecordingSession(inserted, stored)
+
+    assert await PhotosDAL(session).acquire_photo(content_hash=PHOTO_HASH, photo=PHOTO_KEY) == (stored, created)
+    assert "ON CONFLICT (content_hash) DO NOTHING" in str(session.statements[0].compile(dialect=postgresql.dialect()))
+
+
+@pytest.mark.asyncio
+async def test_delete_unreferenced_only_deletes_without_referencing_events():
+    session = RecordingSession(None)
+
+    assert await PhotosDAL(session).delete_unreferenced(content_hash=PHOTO_HASH) is None
+    sql = str(session.statements[0].compile(dialect=postgresql.dialect()))
+    assert "NOT (EXISTS (SELECT" in sql
+    assert "events.photo_hash" in sql
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+        # runs once before the next GETDEL, to interleave another attach
+        self.before_getdel = None
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def getdel(self, key):
+        if self.before_getdel is not None:
+            before_getdel, self.before_getdel = self.before_getdel, None
+            before_getdel()
+        return self.values.pop(key, None)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value.encode()
+
+
+@pytest.fixture
+def redis(monkeypatch) -> FakeRedis:
+    redis = FakeRedis()
+    monkeypatch.setattr(events, "redis_client", redis)
+    monkeypatch.setattr(events, "redis_breaker", RedisCircuitBreaker(client=None, failure_threshold=3, reset_timeout=10.0, probe_interval=5.0))
+    return redis
+
+
+UPLOAD_KEY = f"upload-{'a' * 32}.jpg"
+USER_ID = uuid.uuid4()
+
+
+@pytest.fixture
+def upload(db, s3, redis) -> uuid.UUID:
+    """ An event with a legacy photo, and an issued and uploaded key """
+    event_id = uuid.uuid4()
+    db.events[event_id] = {
+        "event_id": event_id,
+        "photo": "https://static.test/old.jpg",
+        "photo_variants": _variants("old"),
+        "photo_hash": None,
+    }
+    redis.values[events._issued_upload_key(UPLOAD_KEY)] = str(USER_ID).encode()
+    s3.objects[UPLOAD_KEY] = PHOTO
+    return event_id
+
+
+@pytest.mark.asyncio
+async def test_attach_replaces_and_releases_the_previous_photo(db, s3, redis, upload):
+    photo_url = await events._attach_uploaded_photo(upload, UPLOAD_KEY, USER_ID, FakeSession(db))
+
+    assert photo_url == f"https://static.test/{UPLOAD_KEY}"
+    assert db.events[upload]["photo"] == photo_url
+    assert sorted(s3.deleted) == ["old.jpg", "old_full.webp"]
+    assert redis.values == {}
+    assert events.optimize_image_task.calls == [{"event_id": upload, "s3_key": photo_url}]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("s3_key", ["old.jpg", "optimized_old_full.webp", f"upload-{'a' * 32}.jpg/../old.jpg"])
+async def test_attach_rejects_keys_that_were_never_issued(db, s3, redis, upload, s3_key):
+    with pytest.raises(ValueError):
+        await events._attach_uploaded_photo(upload, s3_key, USER_ID, FakeSession(db))
+
+    assert db.events[upload]["photo"] == "https://static.test/old.jpg"
+
+
+@pytest.mark.asyncio
+async def test_attach_rejects_a_key_issued_to_another_user(db, s3, redis, upload):
+    with pytest.raises(ValueError):
+        await events._attach_uploaded_photo(upload, UPLOAD_KEY, uuid.uuid4(), FakeSession(db))
+
+    assert events._issued_upload_key(UPLOAD_KEY) in redis.values
+
+
+@pytest.mark.asyncio
+async def test_attach_consumes_the_key_once(db, s3, redis, upload):
+    await events._attach_uploaded_photo(upload, UPLOAD_KEY, USER_ID, FakeSession(db))
+
+    with pytest.raises(ValueError):
+        await events._attach_uploaded_photo(upload, UPLOAD_KEY, USER_ID, FakeSession(db))
+
+
+@pytest.mark.asyncio
+async def test_concurrent_attach_loses_and_rolls_back(db, s3, redis, upload):
+    # another attach of the same key consumes it after our checks passed
+    redis.before_getdel = lambda: redis.values.clear()
+
+    with pytest.raises(ValueError, match="already used"):
+        await events._attach_uploaded_photo(upload, UPLOAD_KEY, USER_ID, FakeSession(db))
+
+    assert db.events[upload]["photo"] == "https://static.test/old.jpg"
+    assert s3.deleted == []
+
+
+@pytest.mark.asyncio
+async def test_attach_keeps_the_key_while_the_object_is_missing(db, s3, redis, upload):
+    del s3.objects[UPLOAD_KEY]
+
+    with pytest.raises(ValueError, match="not found"):
+        await events._attach_uploaded_photo(upload, UPLOAD_KEY, USER_ID, FakeSession(db))
+
+    assert events._issued_upload_key(UPLOAD_KEY) in redis.values
+
+
+@pytest.mark.asyncio
+async def test_attach_reports_other_storage_errors_as_unavailable(db, s3, redis, upload):
+    s3.fail_head = True
+
+    with pytest.raises(events.UploadStorageUnavailable):
+        await events._attach_uploaded_photo(upload, UPLOAD_KEY, USER_ID, FakeSession(db))
+
+    assert events._issued_upload_key(UPLOAD_KEY) in redis.values
+
+
+@pytest.mark.asyncio
+async def test_failed_update_leaves_the_key_issued(db, s3, redis, upload):
+    db.fail_update = True
+
+    with pytest.raises(IntegrityError):
+        await events._attach_uploaded_photo(upload, UPLOAD_KEY, USER_ID, FakeSession(db))
+
+    assert events._issued_upload_key(UPLOAD_KEY) in redis.values
+
+
+@pytest.mark.asyncio
+async def test_failed_commit_reissues_the_consumed_key(db, s3, redis, upload):
+    db.fail_commit = True
+
+    with pytest.raises(ConnectionError):
+        await events._attach_uploaded_photo(upload, UPLOAD_KEY, USER_ID, FakeSession(db))
+
+    assert db.events[upload]["photo"] == "https://static.test/old.jpg"
+    assert redis.values[events._issued_upload_key(UPLOAD_KEY)] == str(USER_ID).encode()
+    assert s3.deleted == []
+
+    db.fail_commit = False
+    assert await events._attach_uploaded_photo(upload, UPLOAD_KEY, USER_ID, FakeSession(db)) == f"https://static.test/{UPLOAD_KEY}"
@@ -0,0 +1,37 @@
+import base64
+import datetime
+import uuid
+import pytest
+from api.actions.events import encode_cursor, decode_cursor, _pack_feed_page, _unpack_feed_page
+
+
+def test_cursor_round_trip():
+    created_at = datetime.datetime(2025, 3, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc)
+    event_id = uuid.uuid4()
+
+    assert decode_cursor(encode_cursor(created_at, event_id)) == (created_at, event_id)
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor(datetime.datetime.now(datetime.timezone.utc), uuid.uuid4())
+    assert all(c.isalnum() or c in "-_=" for c in cursor)
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    base64.urlsafe_b64encode(b"no separator").decode(),
+    base64.urlsafe_b64encode(b"2025-03-01T12:00:00|not-a-uuid").decode(),
+    base64.urlsafe_b64encode(f"yesterday|{uuid.uuid4()}".encode()).decode(),
+    base64.urlsafe_b64encode(b"a|b|c").decode(),
+])
+def test_decode_cursor_rejects_garbage(cursor):
+    # the handler turns ValueError into 400
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_feed_page_round_trip():
+    events_json = b'[{"title": "a\\nb"}]'
+
+    assert _unpack_feed_page(_pack_feed_page(events_json, "abc")) == (events_json, "abc")
+    assert _unpack_feed_page(_pack_feed_page(events_json, None)) == (events_json, None)
@@ -0,0 +1,55 @@
+import asyncio
+import threading
+import pytest
+from hashing import HashingPool, HashingPoolBusy, Hasher
+
+
+@pytest.mark.asyncio
+async def test_runs_function_in_pool():
+    pool = HashingPool(max_workers=2, max_waiting=2)
+
+    assert await pool.run(lambda a, b: a + b, 2, 3) == 5
+    assert pool.stats() == {"active": 0, "waiting": 0, "rejected": 0}
+
+
+@pytest.mark.asyncio
+async def test_rejects_when_queue_is_full():
+    pool = HashingPool(max_workers=1, max_waiting=1)
+    release = threading.Event()
+
+    running = asyncio.create_task(pool.run(release.wait))
+    waiting = asyncio.create_task(pool.run(lambda: "done"))
+    while pool.waiting < 1:
+        await asyncio.sleep(0.01)
+    assert pool.stats()["active"] == 1
+
+    with pytest.raises(HashingPoolBusy):
+        await pool.run(lambda: None)
+    assert pool.stats() == {"active": 1, "waiting": 1, "rejected": 1}
+
+    release.set()
+    assert await running is True
+    assert await waiting == "done"
+    assert pool.stats() == {"active": 0, "waiting": 0, "rejected": 1}
+
+
+@pytest.mark.asyncio
+async def test_loop_stays_responsive_while_hashing():
+    pool = HashingPool(max_workers=1, max_waiting=1)
+    release = threading.Event()
+    job = asyncio.create_task(pool.run(release.wait))
+
+    # the loop keeps serving other work while the job blocks its thread
+    await asyncio.sleep(0.05)
+    assert not job.done()
+    release.set()
+    await job
+
+
+@pytest.mark.asyncio
+async def test_async_hasher_round_trip():
+    hashed_password = await Hasher.get_password_hash_async("secret")
+
+    assert await Hasher.verify_password_async(hashed_password=hashed_password, plain_password="secret")
+    assert not await Hasher.verify_password_async(hashed_password=hashed_password, plain_password="wrong")
+    assert not await Hasher.verify_password_async(hashed_password="not a hash", plain_password="secret")
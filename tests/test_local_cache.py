@@ -0,0 +1,80 @@
+from services import local_cache
+from services.local_cache import LocalCache
+
+
+def _cache(**kwargs) -> LocalCache:
+    options = {"max_items": 10, "max_bytes": 1024, "ttl": 60.0}
+    options.update(kwargs)
+    return LocalCache(**options)
+
+
+def test_get_returns_put_value():
+    cache = _cache()
+    cache.put("a", b"1")
+
+    assert cache.get("a") == b"1"
+    assert cache.get("b") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "items": 1, "bytes": 1}
+
+
+def test_evicts_least_recently_used_item():
+    cache = _cache(max_items=2)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    cache.get("a")
+    cache.put("c", b"3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+    assert cache.get("c") == b"3"
+
+
+def test_evicts_to_stay_under_max_bytes():
+    cache = _cache(max_bytes=10)
+    cache.put("a", b"12345")
+    cache.put("b", b"12345")
+    cache.put("c", b"123")
+
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 8
+
+
+def test_skips_values_larger_than_max_bytes():
+    cache = _cache(max_bytes=4)
+    cache.put("a", b"12345")
+
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_replacing_a_key_keeps_size_accurate():
+    cache = _cache()
+    cache.put("a", b"12345")
+    cache.put("a", b"12")
+
+    assert cache.get("a") == b"12"
+    assert cache.stats()["bytes"] == 2
+
+
+def test_expired_entries_are_dropped(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(local_cache.time, "monotonic", lambda: now)
+    cache = _cache(ttl=5.0)
+    cache.put("a", b"1")
+
+    now += 6.0
+    assert cache.get("a") is None
+    assert cache.stats()["items"] == 0
+
+
+def test_put_from_before_clear_is_dropped():
+    cache = _cache()
+    # a load started, then an invalidation arrived before it finished
+    generation = cache.generation
+    cache.clear()
+    cache.put("a", b"stale", generation)
+
+    assert cache.get("a") is None
+
+    cache.put("a", b"fresh", cache.generation)
+    assert cache.get("a") == b"fresh"
@@ -0,0 +1,103 @@
+import asyncio
+import pytest
+from api.actions import auth
+from services.redis_service import RedisCircuitBreaker, BreakerState
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def incr(self, key):
+        self.commands.append(("incr", key))
+
+    def expire(self, key, ttl):
+        self.commands.append(("expire", key))
+
+    def delete(self, key):
+        self.commands.append(("delete", key))
+
+    async def execute(self):
+        if self.redis.down:
+            raise ConnectionError("redis down")
+        self.redis.executed.extend(self.commands)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.down = False
+        self.executed = []
+        self.reads = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def mget(self, *keys):
+        self.reads += 1
+        return [None, None]
+
+
+@pytest.fixture
+def redis(monkeypatch) -> FakeRedis:
+    redis = FakeRedis()
+    monkeypatch.setattr(auth, "redis_client", redis)
+    monkeypatch.setattr(auth, "redis_breaker", RedisCircuitBreaker(client=None, failure_threshold=3, reset_timeout=10.0, probe_interval=5.0))
+    monkeypatch.setattr(auth, "_pending_invalidations", set())
+    return redis
+
+
+@pytest.mark.asyncio
+async def test_invalidates_while_the_breaker_is_open(redis):
+    for _ in range(3):
+        auth.redis_breaker.record_failure()
+    assert auth.redis_breaker.state == BreakerState.OPEN
+
+    assert await auth.invalidate_principal("user-1")
+    assert ("delete", auth._principal_key("user-1")) in redis.executed
+    assert auth.redis_breaker.state == BreakerState.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_failed_invalidation_bypasses_the_cache_until_retried(redis):
+    redis.down = True
+    assert not await auth.invalidate_principal("user-1")
+
+    # neither read nor filled while the old entry may still be in Redis
+    assert await auth._get_cached_principal("user-1") == (None, None)
+    assert redis.reads == 0
+
+    redis.down = False
+    assert await auth.invalidate_principal("user-1")
+    assert await auth._get_cached_principal("user-1") == (None, "")
+    assert redis.reads == 1
+
+
+@pytest.mark.asyncio
+async def test_retry_task_flushes_pending_invalidations(redis, monkeypatch):
+    redis.down = True
+    await auth.invalidate_principal("user-1")
+    await auth.invalidate_principal("user-2")
+    redis.down = False
+
+    rounds = 0
+
+    async def sleep(delay):
+        nonlocal rounds
+        rounds += 1
+        if rounds > 1:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(auth.asyncio, "sleep", sleep)
+    with pytest.raises(asyncio.CancelledError):
+        await auth.retry_principal_invalidations()
+
+    assert auth._pending_invalidations == set()
+    deleted = {key for command, key in redis.executed if command == "delete"}
+    assert deleted == {auth._principal_key("user-1"), auth._principal_key("user-2")}
@@ -0,0 +1,65 @@
+import pytest
+from services import rate_limit
+from services.rate_limit import TokenBucketLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_allows_burst_then_refuses(clock):
+    limiter = TokenBucketLimiter(rate=1.0, burst=3)
+
+    assert [limiter.allow("a") for _ in range(4)] == [True, True, True, False]
+
+
+def test_refills_at_rate(clock):
+    limiter = TokenBucketLimiter(rate=2.0, burst=2)
+    limiter.allow("a")
+    limiter.allow("a")
+    assert not limiter.allow("a")
+
+    clock[0] += 0.5
+    assert limiter.allow("a")
+    assert not limiter.allow("a")
+
+    # never more than burst, however long the key was idle
+    clock[0] += 60.0
+    assert [limiter.allow("a") for _ in range(3)] == [True, True, False]
+
+
+def test_keys_have_separate_buckets(clock):
+    limiter = TokenBucketLimiter(rate=1.0, burst=1)
+
+    assert limiter.allow("a")
+    assert not limiter.allow("a")
+    assert limiter.allow(("sender", "b"))
+
+
+def test_cost_above_tokens_is_refused_without_spending(clock):
+    limiter = TokenBucketLimiter(rate=1.0, burst=2)
+
+    assert not limiter.allow("a", cost=3)
+    assert limiter.allow("a", cost=2)
+
+
+def test_least_recently_used_keys_are_dropped(clock):
+    limiter = TokenBucketLimiter(rate=1.0, burst=1, max_keys=2)
+    limiter.allow("a")
+    limiter.allow("b")
+    limiter.allow("c")
+
+    # "a" was forgotten and starts again with a full bucket
+    assert limiter.allow("a")
+    assert not limiter.allow("c")
+
+
+def test_forget(clock):
+    limiter = TokenBucketLimiter(rate=1.0, burst=1)
+    limiter.allow("a")
+    limiter.forget("a")
+
+    assert limiter.allow("a")
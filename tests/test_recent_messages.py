@@ -0,0 +1,75 @@
+import datetime
+from bson import ObjectId
+from services.recent_messages import RecentMessages
+
+
+START = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _entries(count: int) -> list:
+    return [
+        ((START + datetime.timedelta(seconds=i), ObjectId()), f"m{i}".encode())
+        for i in range(count)
+    ]
+
+
+def _values(page) -> list[bytes]:
+    return [value for _, value in page]
+
+
+def test_cold_window_misses():
+    recent = RecentMessages(max_items=10)
+
+    assert recent.page(limit=5) is None
+    assert recent.stats() == {"hits": 0, "misses": 1, "items": 0}
+
+
+def test_latest_page_and_before_cursor():
+    recent = RecentMessages(max_items=10)
+    entries = _entries(8)
+    recent.warm(entries, has_all=True)
+
+    assert _values(recent.page(limit=3)) == [b"m5", b"m6", b"m7"]
+    assert _values(recent.page(limit=3, before=entries[5][0])) == [b"m2", b"m3", b"m4"]
+    # storage has nothing older, so a short page is still complete
+    assert _values(recent.page(limit=3, before=entries[1][0])) == [b"m0"]
+
+
+def test_after_cursor():
+    recent = RecentMessages(max_items=10)
+    entries = _entries(8)
+    recent.warm(entries, has_all=False)
+
+    assert _values(recent.page(limit=2, after=entries[3][0])) == [b"m4", b"m5"]
+    assert recent.page(limit=2, after=entries[0][0]) is not None
+
+
+def test_pages_reaching_past_the_window_miss():
+    recent = RecentMessages(max_items=5)
+    entries = _entries(8)
+    recent.warm(entries, has_all=False)
+
+    assert recent.stats()["items"] == 5
+    assert _values(recent.page(limit=5)) == [b"m3", b"m4", b"m5", b"m6", b"m7"]
+    assert recent.page(limit=6) is None
+    assert recent.page(limit=2, before=entries[4][0]) is None
+    assert recent.page(limit=2, after=entries[1][0]) is None
+
+
+def test_out_of_order_and_duplicate_messages():
+    recent = RecentMessages(max_items=10)
+    entries = _entries(4)
+    recent.warm([], has_all=True)
+    for entry in (entries[0], entries[2], entries[1], entries[3], entries[2]):
+        recent.add(*entry)
+
+    assert _values(recent.page(limit=10)) == [b"m0", b"m1", b"m2", b"m3"]
+
+
+def test_eviction_clears_has_all():
+    recent = RecentMessages(max_items=2)
+    recent.warm(_entries(2), has_all=True)
+    assert recent.page(limit=5) is not None
+
+    recent.add(*_entries(3)[2])
+    assert recent.page(limit=5) is None
@@ -0,0 +1,92 @@
+import pytest
+from services import redis_service
+from services.redis_service import RedisCircuitBreaker, BreakerState
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(redis_service.time, "monotonic", clock)
+    return clock
+
+
+def _breaker() -> RedisCircuitBreaker:
+    return RedisCircuitBreaker(client=None, failure_threshold=3, reset_timeout=10.0, probe_interval=5.0)
+
+
+def _open(breaker: RedisCircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+
+def test_opens_after_threshold_failures(clock):
+    breaker = _breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == BreakerState.OPEN
+    assert not breaker.allow_request()
+
+
+def test_success_resets_failure_count(clock):
+    breaker = _breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == BreakerState.CLOSED
+
+
+def test_half_open_admits_a_single_trial(clock):
+    breaker = _breaker()
+    _open(breaker)
+    clock.now += 10.0
+
+    assert breaker.allow_request()
+    assert breaker.state == BreakerState.HALF_OPEN
+    # concurrent requests wait for the trial's result
+    assert not breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == BreakerState.CLOSED
+    assert breaker.allow_request()
+    assert breaker.allow_request()
+
+
+def test_failed_trial_reopens(clock):
+    breaker = _breaker()
+    _open(breaker)
+    clock.now += 10.0
+
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == BreakerState.OPEN
+    assert not breaker.allow_request()
+
+    clock.now += 10.0
+    assert breaker.allow_request()
+
+
+def test_unfinished_trial_expires(clock):
+    breaker = _breaker()
+    _open(breaker)
+    clock.now += 10.0
+    assert breaker.allow_request()
+
+    # the trial never reported back
+    clock.now += 5.0
+    assert not breaker.allow_request()
+    clock.now += 5.0
+    assert breaker.allow_request()
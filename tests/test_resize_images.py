@@ -0,0 +1,80 @@
+import io
+import pytest
+from PIL import Image, ExifTags
+from services.resize_images import decode_for_box, render_variants, REDUCING_GAP
+
+
+def _encode(img: Image.Image, image_format: str, **options) -> io.BytesIO:
+    output = io.BytesIO()
+    img.save(output, format=image_format, **options)
+    output.seek(0)
+    return output
+
+
+def _assert_decoded_for(img: Image.Image, box: tuple[int, int]):
+    # large enough to resample into the box, far smaller than the original
+    assert img.width >= box[0] or img.height >= box[1]
+    assert img.width <= box[0] * REDUCING_GAP * 2
+    assert img.height <= box[1] * REDUCING_GAP * 2
+
+
+@pytest.mark.parametrize("image_format", ["JPEG", "PNG"])
+def test_decodes_close_to_the_box(image_format):
+    original = Image.new("RGB", (4000, 3000), (200, 120, 40))
+    img = decode_for_box(_encode(original, image_format), (320, 320))
+
+    _assert_decoded_for(img, (320, 320))
+    assert img.mode == "RGB"
+    # aspect ratio survives the reduced decode
+    assert abs(img.width / img.height - 4 / 3) < 0.01
+
+
+@pytest.mark.parametrize("mode, expected_mode", [
+    ("P", "RGBA"),
+    ("1", "RGB"),
+    ("I;16", "RGB"),
+])
+def test_reduces_modes_reduce_does_not_support(mode, expected_mode):
+    original = Image.new(mode, (8000, 6000))
+    img = decode_for_box(_encode(original, "PNG"), (1920, 1080))
+
+    _assert_decoded_for(img, (1920, 1080))
+    assert img.mode == expected_mode
+
+
+def test_small_images_are_not_reduced():
+    original = Image.new("RGB", (300, 200))
+    img = decode_for_box(_encode(original, "JPEG"), (1920, 1080))
+
+    assert img.size == (300, 200)
+
+
+def test_applies_exif_rotation():
+    original = Image.new("RGB", (4000, 3000))
+    exif = Image.Exif()
+    exif[ExifTags.Base.Orientation] = 6
+    img = decode_for_box(_encode(original, "JPEG", exif=exif.tobytes()), (960, 960))
+
+    assert img.height > img.width
+    _assert_decoded_for(img, (960, 960))
+
+
+def test_keeps_alpha():
+    original = Image.new("RGBA", (2000, 2000), (0, 0, 0, 0))
+    img = decode_for_box(_encode(original, "PNG"), (320, 320))
+
+    assert img.mode == "RGBA"
+
+
+def test_renders_every_variant_and_format():
+    img = decode_for_box(_encode(Image.new("RGB", (4000, 3000)), "JPEG"), (1920, 1080))
+    variants = {"thumbnail": (320, 320), "full": (1920, 1080)}
+
+    rendered = render_variants(img, variants, ["webp", "jpeg"])
+
+    assert set(rendered) == set(variants)
+    assert (rendered["thumbnail"]["width"], rendered["thumbnail"]["height"]) == (320, 240)
+    assert (rendered["full"]["width"], rendered["full"]["height"]) == (1440, 1080)
+    for variant in rendered.values():
+        assert set(variant["files"]) == {"webp", "jpeg"}
+        assert Image.open(variant["files"]["jpeg"]).size == (variant["width"], variant["height"])
@@ -0,0 +1,131 @@
+import hashlib
+import io
+import os
+import tracemalloc
+import pytest
+import pytest_asyncio
+from services.s3_service import S3Client
+from benchmarks.common import moto_server
+
+
+PART_SIZE = 5 * 1024 * 1024
+OBJECT_SIZE = 8 * PART_SIZE
+
+
+# a prime length, so consecutive parts don't repeat each other
+PATTERN = os.urandom(1024 * 1024 + 7)
+
+
+class GeneratedFile(io.RawIOBase):
+    """ `size` bytes produced on read, never all in memory """
+
+    def __init__(self, size: int):
+        self.remaining = size
+        self.offset = 0
+        self.sha256 = hashlib.sha256()
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.remaining
+        size = min(size, self.remaining)
+        data = io.BytesIO()
+        while data.tell() < size:
+            piece = PATTERN[self.offset:self.offset + size - data.tell()]
+            data.write(piece)
+            self.offset = (self.offset + len(piece)) % len(PATTERN)
+        self.remaining -= size
+        self.sha256.update(data.getbuffer())
+        return data.getvalue()
+
+
+@pytest.fixture(scope="module")
+def s3_endpoint():
+    pytest.importorskip("moto.server")
+    with moto_server() as endpoint:
+        yield endpoint
+
+
+@pytest_asyncio.fixture
+async def s3(s3_endpoint):
+    client = S3Client(
+        access_key="test",
+        secret_key="test",
+        endpoint_url=s3_endpoint,
+        bucket_name="test-bucket",
+        static_domain="static.test",
+        multipart_part_size=PART_SIZE,
+        download_chunk_size=1024 * 1024,
+    )
+    await client.start()
+    async with client.get_client() as raw_client:
+        try:
+            await raw_client.create_bucket(Bucket="test-bucket")
+        except raw_client.exceptions.BucketAlreadyOwnedByYou:
+            pass
+    yield client
+    await client.close()
+
+
+def _traced_peak(start: int) -> int:
+    _, peak = tracemalloc.get_traced_memory()
+    return peak - start
+
+
+@pytest.mark.asyncio
+async def test_put_file_streams_in_parts(s3):
+    source = GeneratedFile(OBJECT_SIZE)
+
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        url = await s3.put_file(s3_key="large.bin", file=source)
+        peak = _traced_peak(start)
+    finally:
+        tracemalloc.stop()
+
+    assert url == "https://static.test/large.bin"
+    head = await s3.head_file("large.bin")
+    assert head["ContentLength"] == OBJECT_SIZE
+    # a handful of parts at most, never the whole object
+    assert peak < 4 * PART_SIZE
+
+
+@pytest.mark.asyncio
+async def test_iter_file_streams_in_chunks(s3):
+    source = GeneratedFile(OBJECT_SIZE)
+    await s3.put_file(s3_key="download.bin", file=source)
+
+    received = 0
+    sha256 = hashlib.sha256()
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        async for chunk in s3.iter_file("download.bin"):
+            received += len(chunk)
+            sha256.update(chunk)
+        peak = _traced_peak(start)
+    finally:
+        tracemalloc.stop()
+
+    assert received == OBJECT_SIZE
+    assert sha256.hexdigest() == source.sha256.hexdigest()
+    assert peak < 4 * s3.download_chunk_size
+
+
+@pytest.mark.asyncio
+async def test_put_file_small_body_single_put(s3):
+    url = await s3.put_file(s3_key="small.txt", file=b"hello")
+    assert url.endswith("/small.txt")
+
+    sink = io.BytesIO()
+    await s3.download_fileobj("small.txt", sink)
+    assert sink.getvalue() == b"hello"
+
+
+@pytest.mark.asyncio
+async def test_head_file_missing_object(s3):
+    with pytest.raises(FileNotFoundError):
+        await s3.head_file("missing.bin")
@@ -0,0 +1,117 @@
+import asyncio
+import pytest
+from pymongo.errors import BulkWriteError
+from services.write_behind import WriteBehindBuffer, DUPLICATE_KEY_ERROR
+
+
+class FakeModel:
+    """ Stands in for a Beanie document class; fails the next `failures` calls """
+
+    def __init__(self, failures: list[Exception] | None = None):
+        self.batches: list[list] = []
+        self.failures = list(failures or [])
+
+    async def insert_many(self, documents, ordered=True):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.batches.append(list(documents))
+
+
+def _buffer(model, **kwargs) -> WriteBehindBuffer:
+    options = {"max_batch": 3, "flush_interval": 0.05, "max_pending": 10, "retry_backoff_max": 0.01}
+    options.update(kwargs)
+    return WriteBehindBuffer(model, **options)
+
+
+async def _wait_for(predicate, timeout: float = 2.0):
+    async with asyncio.timeout(timeout):
+        while not predicate():
+            await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_writes_in_batches_of_max_batch():
+    model = FakeModel()
+    buffer = _buffer(model, flush_interval=10.0)
+    buffer.start()
+    for i in range(6):
+        assert buffer.put_nowait(i)
+
+    await _wait_for(lambda: buffer.written == 6)
+    assert model.batches == [[0, 1, 2], [3, 4, 5]]
+    await buffer.close()
+
+
+@pytest.mark.asyncio
+async def test_flushes_partial_batch_after_interval():
+    model = FakeModel()
+    buffer = _buffer(model)
+    buffer.start()
+    buffer.put_nowait("a")
+
+    await _wait_for(lambda: buffer.written == 1)
+    assert model.batches == [["a"]]
+    await buffer.close()
+
+
+@pytest.mark.asyncio
+async def test_refuses_documents_when_full():
+    buffer = _buffer(FakeModel(), max_pending=2)
+
+    assert buffer.put_nowait(1)
+    assert buffer.put_nowait(2)
+    assert not buffer.put_nowait(3)
+    assert buffer.stats() == {"pending": 2, "written": 0, "rejected": 1, "batches": 0}
+
+
+@pytest.mark.asyncio
+async def test_retries_failed_batch():
+    model = FakeModel(failures=[ConnectionError("down"), ConnectionError("down")])
+    buffer = _buffer(model)
+    buffer.start()
+    buffer.put_nowait("a")
+
+    await _wait_for(lambda: buffer.written == 1)
+    assert model.batches == [["a"]]
+    await buffer.close()
+
+
+@pytest.mark.asyncio
+async def test_duplicates_from_an_earlier_attempt_count_as_written():
+    error = BulkWriteError({"writeErrors": [
+        {"index": 0, "code": DUPLICATE_KEY_ERROR},
+        {"index": 2, "code": 1},
+    ]})
+    model = FakeModel(failures=[error])
+    buffer = _buffer(model)
+    buffer.start()
+    for document in ("a", "b", "c"):
+        buffer.put_nowait(document)
+
+    # only the document that failed for another reason is retried
+    await _wait_for(lambda: buffer.written == 3)
+    assert model.batches == [["c"]]
+    await buffer.close()
+
+
+@pytest.mark.asyncio
+async def test_close_writes_everything_buffered():
+    model = FakeModel()
+    buffer = _buffer(model, flush_interval=10.0)
+    for i in range(4):
+        buffer.put_nowait(i)
+
+    await buffer.close()
+    assert model.batches == [[0, 1, 2], [3]]
+    assert buffer.stats()["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_close_gives_up_after_attempts():
+    model = FakeModel(failures=[ConnectionError("down")] * 5)
+    buffer = _buffer(model)
+    buffer.put_nowait("a")
+
+    await buffer.close(attempts=2)
+    assert model.batches == []
+    assert buffer.written == 0